@@ -6,6 +6,7 @@ from PySide6.QtWidgets import (
 )
 
 from utils.system import File, Path
+from utils.trace import Tracer
 
 from ui.main import Main_Page
 
@@ -18,7 +19,14 @@ class App():
 
     ) -> None:
         self.config: dict[str, Any] = self._Read_config(
-            config_dir, config_file)
+            config_dir, config_file) or {}
+
+        # trace_file: chrome trace json of every step, written at exit
+        # trace_memory: add the peak allocation of each step (slower)
+        self.trace_file: str | None = self.config.get("trace_file")
+        if self.trace_file:
+            Tracer.Enable(bool(self.config.get("trace_memory", False)))
+
         self.app, self.main_window = self._Set_main_ui()
 
     def _Read_config(self, directory: str, file_name: str):
@@ -33,7 +41,12 @@ class App():
 
     def Run(self):
         self.main_window.show()
-        return self.app.exec()
+        _code = self.app.exec()
+
+        if self.trace_file:
+            print(Tracer.Format_summary())
+            Tracer.Export(self.trace_file)
+        return _code
 
 
 if __name__ == "__main__":
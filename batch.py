@@ -0,0 +1,514 @@
+""" ### Headless batch runner for image process recipe
+
+------------------------------------------------------------------------
+### Requirement
+    None
+
+### Structure
+    Batch_Process: run a recipe over every image in a directory
+        with a process pool, without any Qt window.
+
+### Usage
+    python batch.py <input_dir> <output_dir> <recipe.yaml> [-w WORKERS]
+
+    The recipe file holds the same list that `Apply_Block.Set_process`
+    takes, for example
+
+    ``` yaml
+    - process: Resize
+      arg: {height: 0, width: 1024}
+    - process: Background_Masking
+      arg: {mode: rembg}
+    ```
+
+    Images whose content and recipe match the manifest in the output
+    directory (`.manifest.yaml`) are skipped; use `--force` to redo them.
+
+    Encode options of each output format can be set in a dict recipe,
+    `{process_list: [...], write_option: {png: {compression: 3}}}`
+    (see `utils.image_writer.DEFAULT_OPTION`).
+
+    With `--engine pipeline`, reader, process and writer threads are
+    chained by bounded queues in one process, so decoding the next files
+    overlaps with processing (useful on network drives).
+    `--infer_batch N` then runs the background model on up to N images
+    of the process threads at once.
+
+    `--engine shared` decodes and writes in threads of this process like
+    the pipeline engine, but processes on worker processes that read and
+    return the images through shared memory (no pickled image).
+
+    `--trace trace.json` records read, each step and write of every image
+    (open it in chrome://tracing or Perfetto) and prints a summary table.
+    `--trace_memory` adds the peak allocation of each step (tracemalloc,
+    slower).
+
+"""
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count, path, makedirs
+from time import perf_counter
+from typing import Any, Literal
+
+from utils.system import File, Path
+from utils.image_cache import Result_Cache
+from utils.image_process import (
+    Process, Apply_Block, Session_Manager, Get_recipe)
+from utils.image_writer import Image_Writer
+from utils.pipeline import Pipeline, Stage, Failure
+from utils.shared_image import Parallel_Apply, Shared_Result
+from utils.trace import Tracer
+
+# read-only copy of the manifest in each worker, the parent updates it
+_result_cache: Result_Cache | None = None
+
+
+def _Init_worker(
+    save_dir: str,
+    is_result_cached: bool,
+    write_option: dict[str, dict[str, Any]] | None = None,
+    is_traced: bool = False,
+    is_memory_traced: bool = False
+):
+    global _result_cache
+    _result_cache = Result_Cache(save_dir) if is_result_cached else None
+    Process.writer = Image_Writer(write_option)
+    if is_traced:
+        Tracer.Enable(is_memory_traced)
+
+
+def _Run_tiled(
+    file_path: str,
+    file_name: str,
+    save_dir: str,
+    process_list: list[dict[str, Any]],
+    tile_size: int
+) -> tuple[str, dict[str, Any] | None, bool]:
+    from utils.tiled_process import Tiled_Process
+
+    _tiff_name = f"{path.splitext(file_name)[0]}.tif"
+    makedirs(path.dirname(Path.Join(_tiff_name, save_dir)), exist_ok=True)
+
+    _entry = None
+    if _result_cache is not None:
+        _entry = _result_cache.Make_entry(
+            _tiff_name, file_path,
+            Apply_Block.Get_recipe_key(process_list))
+        if _result_cache.Is_hit(_tiff_name, _entry):
+            return _tiff_name, _entry, True
+
+    Tiled_Process(process_list, tile_size)(
+        file_path, Path.Join(_tiff_name, save_dir), "zlib")
+    return _tiff_name, _entry, False
+
+
+def _Run_process(
+    file_path: str,
+    file_name: str,
+    save_dir: str,
+    process_list: list[dict[str, Any]],
+    tile_size: int = 0
+) -> tuple[
+    str, dict[str, Any] | None, bool, str | None, list[dict[str, Any]]
+]:
+    """
+    #### 이미지 한 장 처리
+    #### -> (결과 파일 이름, 목록 항목, 건너뜀 여부, 오류, 추적 기록)
+    ----------------------------------------------------------------
+    `file_name` 은 입력 경로 기준의 상대 경로 (하위 디렉토리 구조 유지)
+    """
+    _file_name = file_name
+
+    try:
+        if tile_size > 0:  # out-of-core mode for very large images
+            return *_Run_tiled(
+                file_path, _file_name, save_dir, process_list, tile_size
+            ), None, Tracer.Pop_events()
+
+        # one run per image, intermediate results are never reused
+        _block = Apply_Block(
+            save_dir, _file_name, file_path, is_cached=False,
+            result_cache=_result_cache)
+        _block.Set_process(process_list)
+        _block()
+
+    except Exception as _error:  # keep the batch going
+        return _file_name, None, False, (
+            f"{type(_error).__name__}: {_error}"), Tracer.Pop_events()
+
+    _entry = None
+    if _result_cache is not None:
+        _entry = _result_cache.entries.get(_file_name)
+    # events go back to the parent with the result
+    return _file_name, _entry, _block.is_skipped, None, Tracer.Pop_events()
+
+
+class Batch_Process():
+    def __init__(
+        self,
+        input_dir: str,
+        output_dir: str,
+        process_list: list[dict[str, Any]],
+        worker_num: int | None = None,
+        ext_filter: list[str] | None = None,
+        chunk_size: int = 8,
+        tile_size: int = 0,
+        is_result_cached: bool = True,
+        engine: Literal["process", "pipeline", "shared"] = "process",
+        reader_num: int = 2,
+        writer_num: int = 2,
+        queue_size: int = 0,
+        report_interval: float = 0.0,
+        write_option: dict[str, dict[str, Any]] | None = None,
+        is_recursive: bool = False,
+        infer_batch: int = 1,
+        is_traced: bool = False,
+        is_memory_traced: bool = False
+    ) -> None:
+        if engine != "process" and tile_size > 0:
+            raise ValueError("tiled mode runs only on the process engine")
+        if engine != "pipeline" and infer_batch > 1:
+            raise ValueError("batched inference runs only on the pipeline "
+                             "engine")
+
+        self.input_dir = input_dir
+        self.output_dir = Path.Make_directory(output_dir)
+        self.process_list = process_list
+
+        self.worker_num = worker_num or cpu_count() or 1
+        self.ext_filter = ext_filter or ["jpg", "png"]
+        self.is_recursive = is_recursive  # keep sub directories in output
+        self.chunk_size = chunk_size
+        self.tile_size = tile_size
+        self.is_result_cached = is_result_cached
+
+        # pipeline engine: reader / process / writer threads in one process
+        # (shared engine: the process threads hand over to worker processes)
+        self.engine = engine
+        self.reader_num = reader_num
+        self.writer_num = writer_num
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.pipeline: Pipeline | None = None
+        # images of the process threads that share one model run
+        self.infer_batch = infer_batch
+
+        # encode options of each output format (png / jpg / webp)
+        self.write_option = write_option
+
+        # record each step of every image in `Tracer`
+        # (with the peak allocation of each step if memory traced)
+        self.is_traced = is_traced
+        self.is_memory_traced = is_memory_traced
+
+    @staticmethod
+    def Read_recipe(recipe_file: str) -> list[dict[str, Any]]:
+        """
+        #### 처리 과정 파일의 단계 목록. 파일이 없거나 단계가 없으면 오류
+        ----------------------------------------------------------------
+        """
+        if not path.isfile(recipe_file):
+            raise FileNotFoundError(f"recipe {recipe_file} is not exist")
+
+        _dir, _file_name = path.split(path.abspath(recipe_file))
+        _recipe = File.YAML.Read(_file_name, _dir)
+
+        if isinstance(_recipe, dict):  # allow {"process_list": [...]}
+            _recipe = _recipe.get("process_list")
+        if not isinstance(_recipe, list) or not _recipe:
+            raise ValueError(f"recipe {recipe_file} has no process step")
+        return _recipe
+
+    @staticmethod
+    def Read_write_option(recipe_file: str) -> dict[str, dict[str, Any]]:
+        """
+        #### 처리 과정 파일의 형식 별 저장 설정 ({"write_option": {...}})
+        ----------------------------------------------------------------
+        """
+        _dir, _file_name = path.split(path.abspath(recipe_file))
+        _recipe = File.YAML.Read(_file_name, _dir)
+
+        if isinstance(_recipe, dict):
+            return _recipe.get("write_option") or {}
+        return {}
+
+    def _Run_pool(self, files: list[str]):
+        _len_files = len(files)
+        _input_dir = self.input_dir
+        _save_dir = self.output_dir
+
+        # spawn: fork after cv2 / onnxruntime start their threads deadlocks
+        with ProcessPoolExecutor(
+            self.worker_num,
+            mp_context=get_context("spawn"),
+            initializer=_Init_worker,
+            initargs=(
+                _save_dir, self.is_result_cached, self.write_option,
+                self.is_traced, self.is_memory_traced)
+        ) as _pool:
+            yield from _pool.map(
+                _Run_process,
+                files,
+                [path.relpath(_file, _input_dir) for _file in files],
+                [_save_dir] * _len_files,
+                [self.process_list] * _len_files,
+                [self.tile_size] * _len_files,
+                chunksize=self.chunk_size
+            )
+
+    def _Run_pipeline(
+        self, files: list[str], result_cache: Result_Cache | None
+    ):
+        _save_dir = self.output_dir
+        _process_list = self.process_list
+        _step_keys = Apply_Block.Get_step_keys(_process_list)
+        _input_dir = self.input_dir
+        Process.writer = Image_Writer(self.write_option)
+        Session_Manager.Set_batch(min(self.infer_batch, self.worker_num))
+
+        def _Read(file_path: str):
+            _block = Apply_Block(
+                _save_dir, path.relpath(file_path, _input_dir), file_path,
+                is_cached=False, result_cache=result_cache)
+            _block.Set_process(_process_list, _step_keys)
+            if not _block.Check_result():
+                _block.Prefetch()
+            return _block
+
+        def _Process(block: Apply_Block):
+            block(is_write=False)
+            return block
+
+        def _Write(block: Apply_Block):
+            if not block.is_skipped:
+                block.Write()
+            # events of the threads are already in this process
+            return (
+                block.file_name, block.result_entry, block.is_skipped, None,
+                [])
+
+        _parallel = Parallel_Apply(_process_list, self.worker_num) if (
+            self.engine == "shared") else None
+
+        def _Read_shared(file_path: str):
+            _block = Apply_Block(
+                _save_dir, path.relpath(file_path, _input_dir), file_path,
+                is_cached=False, result_cache=result_cache)
+            _block.Set_process(_process_list, _step_keys)
+            return _block, None if _block.Check_result() else _block.Read()
+
+        def _Process_shared(item: tuple[Apply_Block, Any]):
+            _block, _img = item
+            assert _parallel is not None
+            return _block, None if _img is None else _parallel.Apply(
+                _block.file_name, _img)
+
+        def _Write_shared(item: tuple[Apply_Block, Shared_Result | None]):
+            _block, _result = item
+            if _result is not None:
+                with _result:  # free the segment as soon as it is written
+                    assert _result.img is not None
+                    Process.Write(_result.img, _save_dir, _block.file_name)
+            return (
+                _block.file_name, _block.result_entry, _block.is_skipped,
+                None, [])
+
+        _pipeline = Pipeline([
+            Stage("read", _Read, self.reader_num, self.queue_size),
+            Stage("process", _Process, self.worker_num, self.queue_size),
+            Stage("write", _Write, self.writer_num, self.queue_size)
+        ] if _parallel is None else [
+            Stage("read", _Read_shared, self.reader_num, self.queue_size),
+            Stage(
+                "process", _Process_shared, self.worker_num,
+                self.queue_size),
+            Stage("write", _Write_shared, self.writer_num, self.queue_size)
+        ])
+        self.pipeline = _pipeline
+
+        _report_time = perf_counter()
+        try:
+            for _result in _pipeline.Run(files):
+                if isinstance(_result, Failure):
+                    yield self._Get_failure(_result)
+                else:
+                    yield _result
+
+                if self.report_interval > 0 and (
+                    perf_counter() - _report_time >= self.report_interval
+                ):
+                    _report_time = perf_counter()
+                    print(
+                        f"queue depth {_pipeline.Get_depth()}", flush=True)
+        finally:
+            if _parallel is not None:
+                _parallel.Close()
+
+    def _Get_failure(self, failure: Failure):
+        _item = failure.item
+        if isinstance(_item, tuple):  # (block, image or result)
+            _block, _img = _item
+            if isinstance(_img, Shared_Result):
+                _img.Release()
+            _item = _block
+        _file_name = _item.file_name if isinstance(
+            _item, Apply_Block) else path.relpath(_item, self.input_dir)
+        _error = failure.error
+        return _file_name, None, False, (
+            f"{type(_error).__name__}: {_error}"), []
+
+    def Run(self) -> tuple[int, int, list[tuple[str, str]], float]:
+        """
+        #### 처리 실행 -> (전체 수, 건너뛴 수, 실패 목록, 걸린 시간)
+        ----------------------------------------------------------------
+        """
+        _files = Path.Search(
+            self.input_dir, Path.Type.FILE, ext_filter=self.ext_filter,
+            is_recursive=self.is_recursive)
+        _len_files = len(_files)
+        _save_dir = self.output_dir
+        _process_list = self.process_list
+
+        _result_cache = Result_Cache(_save_dir) if (
+            self.is_result_cached) else None
+        if _result_cache is not None:
+            _result_cache.Add_recipe(
+                Apply_Block.Get_recipe_key(_process_list),
+                Get_recipe(_process_list))
+
+        _skip_ct = 0
+        _fail_list: list[tuple[str, str]] = []
+        if self.is_traced:
+            Tracer.Enable(self.is_memory_traced)
+        _st = perf_counter()
+
+        _result = self._Run_pool(_files) if (
+            self.engine == "process") else self._Run_pipeline(
+                _files, _result_cache)
+        for _file_name, _entry, _is_skipped, _error, _events in _result:
+            Tracer.Extend(_events)
+            if _error is not None:
+                _fail_list.append((_file_name, _error))
+                continue
+            _skip_ct += _is_skipped
+            if _result_cache is not None and _entry is not None:
+                _result_cache.Update(_file_name, _entry)
+
+        if _result_cache is not None:
+            _result_cache.Save()
+
+        return _len_files, _skip_ct, _fail_list, perf_counter() - _st
+
+
+def _Get_argument():
+    _parser = argparse.ArgumentParser(
+        description="Apply an image process recipe to every image in a "
+                    "directory without the GUI.")
+    _parser.add_argument("input_dir", type=str)
+    _parser.add_argument("output_dir", type=str)
+    _parser.add_argument("recipe", type=str, help="recipe yaml file")
+    _parser.add_argument(
+        "-w", "--workers", type=int, default=None,
+        help="number of worker processes (default: cpu count)")
+    _parser.add_argument(
+        "-e", "--ext", type=str, nargs="+", default=["jpg", "png"],
+        help="extensions of the input images")
+    _parser.add_argument(
+        "-r", "--recursive", action="store_true",
+        help="search sub directories too, the output keeps the structure")
+    _parser.add_argument(
+        "--chunk_size", type=int, default=8,
+        help="number of images sent to a worker at once")
+    _parser.add_argument(
+        "--tile_size", type=int, default=0,
+        help="process tile by tile and write tiled tiff "
+             "(multiple of 16, 0: off)")
+    _parser.add_argument(
+        "--force", action="store_true",
+        help="process every image even if it is not changed")
+    _parser.add_argument(
+        "--engine", type=str, default="process",
+        choices=["process", "pipeline", "shared"],
+        help="process: worker processes, pipeline: read / process / write "
+             "threads with bounded queues (for slow or network drives), "
+             "shared: pipeline with worker processes for the process "
+             "stage, images go through shared memory")
+    _parser.add_argument(
+        "--readers", type=int, default=2,
+        help="number of reader threads (pipeline / shared engine)")
+    _parser.add_argument(
+        "--writers", type=int, default=2,
+        help="number of writer threads (pipeline / shared engine)")
+    _parser.add_argument(
+        "--queue_size", type=int, default=0,
+        help="max depth of each stage queue (pipeline engine, "
+             "0: twice the threads of the stage)")
+    _parser.add_argument(
+        "--report", type=float, default=0.0,
+        help="print the queue depth every N seconds (pipeline engine)")
+    _parser.add_argument(
+        "--infer_batch", type=int, default=1,
+        help="max images in one background model run (pipeline engine, "
+             "lower it when out of memory)")
+    _parser.add_argument(
+        "--trace", type=str, default=None,
+        help="write a chrome trace json of read, each step and write, "
+             "and print a summary table")
+    _parser.add_argument(
+        "--trace_memory", action="store_true",
+        help="add the peak allocation of each step to the trace "
+             "(tracemalloc, slower)")
+    _arg = _parser.parse_args()
+
+    if _arg.trace_memory and _arg.trace is None:
+        _parser.error("--trace_memory needs --trace")
+    return _arg
+
+
+if __name__ == "__main__":
+    _arg = _Get_argument()
+
+    try:
+        _process_list = Batch_Process.Read_recipe(_arg.recipe)
+    except (OSError, ValueError) as _error:  # nothing to apply
+        sys.exit(f"!!! {_error}")
+
+    _batch = Batch_Process(
+        _arg.input_dir,
+        _arg.output_dir,
+        _process_list,
+        _arg.workers,
+        _arg.ext,
+        _arg.chunk_size,
+        _arg.tile_size,
+        not _arg.force,
+        _arg.engine,
+        _arg.readers,
+        _arg.writers,
+        _arg.queue_size,
+        _arg.report,
+        Batch_Process.Read_write_option(_arg.recipe),
+        _arg.recursive,
+        _arg.infer_batch,
+        _arg.trace is not None,
+        _arg.trace_memory
+    )
+    _total, _skipped, _fails, _time = _batch.Run()
+    _done = _total - _skipped - len(_fails)
+
+    for _file_name, _error in _fails:
+        print(f"!!! {_file_name} is failed -> {_error}")
+    print(
+        f"{_done}/{_total} images in {_time:.2f} s "
+        f"({_done / _time if _time > 0 else 0.0:.2f} images/s, "
+        f"{_batch.worker_num} workers, {_skipped} unchanged skipped)"
+    )
+    if _batch.pipeline is not None:
+        print(f"max queue depth {_batch.pipeline.Get_max_depth()}")
+    if _arg.trace is not None:
+        print(Tracer.Format_summary())
+        print(f"trace is written to {Tracer.Export(_arg.trace)}")
+
+    sys.exit(1 if _fails else 0)
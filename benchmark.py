@@ -0,0 +1,513 @@
+""" ### Benchmark for every image process step
+
+------------------------------------------------------------------------
+### Requirement
+    numpy, opencv, tifffile,
+    rembg (only for the background step, no model file)
+
+### Structure
+    Benchmark: time each `Process` step and `Apply_Block.Run` over
+        synthetic images of several sizes, dtypes and channel layouts,
+        then report median / p95 latency and peak memory as json.
+        Writing the result of `Apply_Block` (tiff encoding) is reported
+        on its own as `Apply_Block_write`.
+        Thumbnail cases (256 px with each interpolation of Resize) report
+        the error from a float INTER_AREA result too.
+        Fusion cases run a Resize (each interpolation, shrink and enlarge)
+        followed by exact steps (Flip, Rotate 0) fused and step by step,
+        and report the mean difference of the two outputs.
+        Tiled cases shrink a large tiff in tiled mode (heavy downscale,
+        fused Resize + Rotate) and report the peak allocation.
+        Startup import time of the GUI and the batch runner is measured
+        in fresh interpreters (`python -X importtime`) as well.
+
+### Usage
+    python benchmark.py -o result.json
+    python benchmark.py -s vga fhd -o new.json --baseline result.json
+
+    With `--baseline`, cases slower than the baseline by more than
+    `--threshold` (rate of the median) are reported and the exit code is 1.
+    The exit code is 1 too if a heavy module (rembg, onnxruntime, ...)
+    is imported at startup instead of at first use, or if a fused output
+    differs from the step by step one more than `FUSION_TOLERANCE`, or if
+    a tiled case allocates more than `TILED_MEMORY_RATE` tiles.
+
+"""
+from __future__ import annotations
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable
+
+import numpy as np
+import cv2
+import tifffile
+
+from utils.image_process import Process, Apply_Block, Session_Manager
+from utils.tiled_process import Tiled_Process
+
+
+SIZE_TABLE: dict[str, tuple[int, int]] = {  # (h, w)
+    "vga": (480, 640),
+    "hd": (720, 1280),
+    "fhd": (1080, 1920),
+    "12mp": (3000, 4000),
+    "24mp": (4000, 6000),
+    "40mp": (5152, 7728),
+    "50mp": (5792, 8688)
+}
+CHANNEL_TABLE: dict[str, int] = {"gray": 1, "bgr": 3, "bgra": 4}
+DTYPE_LIST = ["uint8", "uint16", "float32"]
+
+# entry modules, and modules that must be loaded only at first use
+STARTUP_MODULES = ["app", "batch"]
+HEAVY_MODULES = (
+    "rembg", "onnxruntime", "scipy", "skimage", "numba", "pymatting",
+    "PIL", "tifffile")
+
+# steps after a Resize that must give the same pixels fused or not
+FUSION_CASES: dict[str, list[dict[str, Any]]] = {
+    "Flip": [
+        {"process": "Flip", "arg": {"vertical": True, "horizontal": False}}
+    ],
+    "Rotate_Flip": [
+        {"process": "Rotate", "arg": {
+            "rotate": 0, "center_rate": (0.5, 0.5)}},
+        {"process": "Flip", "arg": {"vertical": False, "horizontal": True}}
+    ]
+}
+FUSION_HEIGHTS: list[int | float] = [256, 0.5, 1.25]  # shrink / enlarge
+FUSION_TOLERANCE = 2 / 255  # mean difference, rate of the value range
+
+# tiled mode must not read the whole source for a small output
+TILED_CASES: dict[str, list[dict[str, Any]]] = {
+    "Thumbnail": [
+        {"process": "Resize", "arg": {"height": 256, "width": 0}}
+    ],
+    "Thumbnail_linear": [
+        {"process": "Resize", "arg": {
+            "height": 256, "width": 0, "interpolation": "linear"}}
+    ],
+    "Resize_Rotate": [
+        {"process": "Resize", "arg": {"height": 0.1}},
+        {"process": "Rotate", "arg": {
+            "rotate": 30, "center_rate": (0.5, 0.5)}}
+    ]
+}
+TILED_SIZE = "24mp"
+TILED_TILE_SIZE = 256
+TILED_MEMORY_RATE = 64  # peak allocation, in bytes of one tile
+
+
+class Stub_Session():
+    """ 모델 없이 rembg 세션 흉내 (타원 마스크) - 후처리 비용만 측정 """
+    def predict(self, img, *args, **kwargs):
+        from PIL import Image
+
+        _w, _h = img.size
+        _mask = np.zeros((_h, _w), np.uint8)
+        cv2.ellipse(
+            _mask, (_w // 2, _h // 2), (_w // 3, _h // 3), 0, 0, 360, 255, -1)
+        return [Image.fromarray(_mask, mode="L")]
+
+
+def Make_image(size: str, dtype: str, channel: str, seed: int = 0):
+    """
+    #### 재현 가능한 합성 이미지 (밝은 배경 위 사각 물체 + 잡음)
+    ----------------------------------------------------------------
+    """
+    _h, _w = SIZE_TABLE[size]
+    _rng = np.random.default_rng(seed)
+
+    _img = np.full((_h, _w), 200, np.uint8)
+    cv2.rectangle(
+        _img, (_w // 4, _h // 4), (_w * 3 // 4, _h * 3 // 4), 60, -1)
+    _img = cv2.add(_img, _rng.integers(0, 20, (_h, _w), np.uint8))
+
+    _c = CHANNEL_TABLE[channel]
+    if _c > 1:
+        _img = cv2.merge([_img] * 3 + ([np.full_like(_img, 255)] * (_c - 3)))
+
+    if dtype == "uint16":
+        return _img.astype(np.uint16) * 257
+    if dtype == "float32":
+        return _img.astype(np.float32) / 255
+    return _img
+
+
+def Make_cases(
+    shape: tuple[int, ...]
+) -> dict[str, Callable[[np.ndarray], Any]]:
+    _h, _w = shape[:2]
+    _mask = np.zeros((_h, _w), bool)
+    _mask[_h // 8: -_h // 8, _w // 8: -_w // 8] = True
+
+    return {
+        "Resize": Process.Resize(0.5),
+        "Flip": Process.Flip(True, True),
+        "Rotate": Process.Rotate(30, (0.5, 0.5)),
+        "Masking": Process.Masking(_mask),
+        "Crop_manual": Process.Crop(False, (0.1, 0.1), (0.8, 0.8)),
+        "Crop_auto": Process.Crop(True, (0, 0), (1, 1)),
+        "Background_Masking": Process.Background_Masking("rembg"),
+        # 256 px thumbnail (long side) with each interpolation
+        **{
+            f"Thumbnail_{_name}": Process.Resize(
+                *((256, 0) if _h > _w else (0, 256)), _name)
+            for _name in ["auto", *Process.Resize.INTERPOLATION]
+        }
+    }
+
+
+def Get_resize_error(img: np.ndarray, output: np.ndarray) -> float:
+    """
+    #### 부동소수 INTER_AREA 결과와의 평균 절대 오차 (값 범위 대비 비율)
+    ----------------------------------------------------------------
+    축소 결과의 품질 (계단 현상, 흐림) 지표. 낮을수록 좋음
+    """
+    _reference = cv2.resize(
+        img.astype(np.float64), output.shape[1::-1],
+        interpolation=cv2.INTER_AREA).reshape(output.shape)
+    _range = np.iinfo(img.dtype).max if img.dtype.kind in "iu" else 1
+    return float(np.abs(output - _reference).mean() / _range)
+
+
+def Get_fusion_error(
+    img: np.ndarray, process_list: list[dict[str, Any]]
+) -> float:
+    """
+    #### 합친 warp 와 단계별 실행 결과의 평균 절대 차이 (값 범위 대비 비율)
+    ----------------------------------------------------------------
+    """
+    _outputs = []
+    for _is_fused in (True, False):
+        _block = Apply_Block(
+            "", "fusion.tiff", img, is_fused=_is_fused, is_cached=False)
+        _block.Set_process(process_list)
+        _block(is_write=False)
+        _outputs.append(_block.output_img.astype(np.float64))
+
+    _range = np.iinfo(img.dtype).max if img.dtype.kind in "iu" else 1
+    return float(np.abs(_outputs[0] - _outputs[1]).mean() / _range)
+
+
+def Read_import_time(
+    module: str, log: str
+) -> tuple[float, list[tuple[str, float]], list[str]]:
+    """
+    #### `-X importtime` 기록 -> (전체 ms, 직접 불러온 모듈 별 ms, 무거운 모듈)
+    ----------------------------------------------------------------
+    """
+    _total = 0.0
+    _children: list[tuple[str, float]] = []
+    _top: list[tuple[str, float]] = []
+    _heavy: set[str] = set()
+
+    for _line in log.splitlines():
+        if not _line.startswith("import time:") or "|" not in _line:
+            continue
+        _, _cumulative, _name = _line.split("|")
+        if not _cumulative.strip().isdigit():  # header
+            continue
+
+        _module = _name.strip()
+        _depth = (len(_name) - len(_name.lstrip()) - 1) // 2
+        _ms = int(_cumulative) / 1000
+
+        if _module.split(".")[0] in HEAVY_MODULES:
+            _heavy.add(_module.split(".")[0])
+        if _depth == 1:
+            _children.append((_module, _ms))
+        elif _depth == 0:  # children are logged before their parent
+            if _module == module:
+                _total, _top = _ms, _children
+            _children = []
+
+    return _total, sorted(_top, key=lambda _item: -_item[1]), sorted(_heavy)
+
+
+class Benchmark():
+    def __init__(
+        self,
+        sizes: list[str],
+        dtypes: list[str],
+        channels: list[str],
+        repeat: int = 5,
+        warmup: int = 1
+    ) -> None:
+        self.sizes = sizes
+        self.dtypes = dtypes
+        self.channels = channels
+        self.repeat = repeat
+        self.warmup = warmup
+
+        self.result: dict[str, dict[str, Any]] = {}
+
+    def _Measure(self, func: Callable[[], Any]) -> dict[str, Any]:
+        for _ in range(self.warmup):
+            func()
+
+        _times = []
+        for _ in range(self.repeat):
+            _st = perf_counter()
+            func()
+            _times.append((perf_counter() - _st) * 1000)
+
+        # peak memory in a separate run, tracing slows the timed runs
+        tracemalloc.start()
+        func()
+        _, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "median_ms": float(np.median(_times)),
+            "p95_ms": float(np.percentile(_times, 95)),
+            "peak_bytes": int(_peak),
+            "repeat": self.repeat
+        }
+
+    def _Run_case(self, case_id: str, func: Callable[[], Any]):
+        try:
+            self.result[case_id] = self._Measure(func)
+        except Exception as _error:  # unsupported dtype / layout
+            self.result[case_id] = {
+                "error": f"{type(_error).__name__}: {_error}"}
+        print(case_id, self.result[case_id], flush=True)
+
+    def Run_startup(self, modules: list[str]) -> dict[str, Any]:
+        """
+        #### 새 인터프리터에서 모듈을 불러오는 시간 측정
+        ----------------------------------------------------------------
+        """
+        _work_dir = path.dirname(path.abspath(__file__))
+
+        for _module in modules:
+            _case_id = f"Startup/{_module}"
+            _times = []
+            _top: list[tuple[str, float]] = []
+            _heavy: list[str] = []
+
+            for _ct in range(self.warmup + self.repeat):
+                _run = subprocess.run(
+                    [sys.executable, "-X", "importtime", "-c",
+                     f"import {_module}"],
+                    cwd=_work_dir, capture_output=True, text=True)
+                if _run.returncode:
+                    self.result[_case_id] = {
+                        "error": _run.stderr.strip().splitlines()[-1]}
+                    break
+                _total, _top, _heavy = Read_import_time(_module, _run.stderr)
+                if _ct >= self.warmup:  # the first one compiles pyc
+                    _times.append(_total)
+            else:
+                self.result[_case_id] = {
+                    "median_ms": float(np.median(_times)),
+                    "p95_ms": float(np.percentile(_times, 95)),
+                    "repeat": self.repeat,
+                    "top": [[_name, _ms] for _name, _ms in _top[:10]],
+                    "heavy": _heavy
+                }
+            print(_case_id, self.result[_case_id], flush=True)
+        return self.result
+
+    def Run(self) -> dict[str, Any]:
+        Session_Manager.Register(Stub_Session())
+
+        with TemporaryDirectory() as _save_dir:
+            for _size in self.sizes:
+                for _dtype in self.dtypes:
+                    for _channel in self.channels:
+                        _img = Make_image(_size, _dtype, _channel)
+                        _tag = f"{_size}/{_dtype}/{_channel}"
+
+                        for _name, _step in Make_cases(_img.shape).items():
+                            _case_id = f"{_name}/{_tag}"
+                            self._Run_case(_case_id, lambda: _step(_img))
+
+                            _case = self.result[_case_id]
+                            if _name.startswith("Thumbnail_") and (
+                                "error" not in _case
+                            ):  # speed / quality tradeoff
+                                _case["resize_error"] = Get_resize_error(
+                                    _img, _step(_img))
+
+                        _block = Apply_Block(
+                            _save_dir, "bench.tiff", _img, is_cached=False)
+                        _block.Set_process([
+                            {"process": "Resize", "arg": {"height": 0.5}},
+                            {"process": "Rotate", "arg": {
+                                "rotate": 30, "center_rate": (0.5, 0.5)}},
+                            {"process": "Crop", "arg": {
+                                "is_auto": False,
+                                "lt_position_rate": (0.1, 0.1),
+                                "crop_size_rate": (0.8, 0.8)}}
+                        ])
+                        self._Run_case(f"Apply_Block/{_tag}", _block.Run)
+
+                        # encoding the same result, apart from the steps
+                        _output = _block.output_img
+                        self._Run_case(
+                            f"Apply_Block_write/{_tag}",
+                            lambda: Process.Write(
+                                _output, _save_dir, "bench.tiff"))
+                        self.Run_fusion(_img, _tag)
+
+        Session_Manager.Clear()
+        return self.result
+
+    def Run_fusion(self, img: np.ndarray, tag: str):
+        """
+        #### 보간 방식 별 Resize + 정확한 단계의 합친 / 단계별 결과 비교
+        ----------------------------------------------------------------
+        """
+        for _name in ["auto", *Process.Resize.INTERPOLATION]:
+            for _height in FUSION_HEIGHTS:
+                _resize = {"process": "Resize", "arg": {
+                    "height": _height, "width": 0, "interpolation": _name}}
+
+                for _case, _steps in FUSION_CASES.items():
+                    _case_id = f"Fusion/{_name}/{_height}/{_case}/{tag}"
+                    try:
+                        self.result[_case_id] = {
+                            "fusion_error": Get_fusion_error(
+                                img, [_resize, *_steps])}
+                    except Exception as _error:  # unsupported dtype
+                        self.result[_case_id] = {
+                            "error": f"{type(_error).__name__}: {_error}"}
+                    print(_case_id, self.result[_case_id], flush=True)
+
+    def Run_tiled(self) -> dict[str, Any]:
+        """
+        #### 큰 tiff 를 타일 단위로 크게 줄일 때의 시간과 최대 할당량
+        ----------------------------------------------------------------
+        """
+        _img = Make_image(TILED_SIZE, "uint8", "bgr")
+        _tile_bytes = TILED_TILE_SIZE ** 2 * _img.shape[2] * _img.itemsize
+
+        with TemporaryDirectory() as _temp_dir:
+            _src = path.join(_temp_dir, "tiled.tiff")
+            _out = path.join(_temp_dir, "tiled_out.tiff")
+            tifffile.imwrite(_src, _img)  # plain strips, opened as memmap
+            del _img  # only the file is read from here
+
+            for _name, _process_list in TILED_CASES.items():
+                _case_id = f"Tiled/{_name}/{TILED_SIZE}"
+                _tiled = Tiled_Process(_process_list, TILED_TILE_SIZE)
+                self._Run_case(_case_id, lambda: _tiled(_src, _out))
+                self.result[_case_id]["tile_bytes"] = _tile_bytes
+        return self.result
+
+    @staticmethod
+    def Get_meta() -> dict[str, str]:
+        return {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cv2_threads": str(cv2.getNumThreads())
+        }
+
+    @staticmethod
+    def Compare(
+        result: dict[str, dict[str, Any]],
+        baseline: dict[str, dict[str, Any]],
+        threshold: float = 0.1
+    ) -> list[tuple[str, float, float]]:
+        """
+        #### 기준 결과보다 중앙값이 threshold 비율 이상 느려진 항목 목록
+        ----------------------------------------------------------------
+        """
+        _regression = []
+        for _case, _new in result.items():
+            _old = baseline.get(_case, {})
+            if "median_ms" not in _new or "median_ms" not in _old:
+                continue
+            if _new["median_ms"] > _old["median_ms"] * (1 + threshold):
+                _regression.append(
+                    (_case, _old["median_ms"], _new["median_ms"]))
+        return _regression
+
+
+def _Get_argument():
+    _parser = argparse.ArgumentParser(
+        description="Benchmark every image process step.")
+    _parser.add_argument(
+        "-s", "--sizes", nargs="+", default=["vga", "hd", "fhd", "12mp"],
+        choices=list(SIZE_TABLE))
+    _parser.add_argument(
+        "-d", "--dtypes", nargs="+", default=DTYPE_LIST, choices=DTYPE_LIST)
+    _parser.add_argument(
+        "-c", "--channels", nargs="+", default=list(CHANNEL_TABLE),
+        choices=list(CHANNEL_TABLE))
+    _parser.add_argument("-r", "--repeat", type=int, default=5)
+    _parser.add_argument("-o", "--output", type=str, default=None)
+    _parser.add_argument("--baseline", type=str, default=None)
+    _parser.add_argument("--threshold", type=float, default=0.1)
+    _parser.add_argument(
+        "--startup", type=str, default="with",
+        choices=["with", "skip", "only"],
+        help="measure the import time of the entry modules")
+    return _parser.parse_args()
+
+
+if __name__ == "__main__":
+    _arg = _Get_argument()
+
+    _bench = Benchmark(_arg.sizes, _arg.dtypes, _arg.channels, _arg.repeat)
+    if _arg.startup != "only":
+        _bench.Run()
+        _bench.Run_tiled()
+    if _arg.startup != "skip":
+        _bench.Run_startup(STARTUP_MODULES)
+    _result = _bench.result
+
+    # heavy dependencies must be imported at first use, not at startup
+    _eager = {
+        _case: _value["heavy"] for _case, _value in _result.items()
+        if _value.get("heavy")
+    }
+    for _case, _heavy in _eager.items():
+        print(f"!!! {_case} imports {', '.join(_heavy)} at startup")
+
+    # explicit interpolation must not change when the steps are fused
+    _mismatch = {
+        _case: _value["fusion_error"] for _case, _value in _result.items()
+        if _value.get("fusion_error", 0) > FUSION_TOLERANCE
+    }
+    for _case, _error in _mismatch.items():
+        print(f"!!! {_case} differs when fused: {_error:.4f}")
+
+    # tiled mode keeps the memory in proportion to the tile size
+    _unbounded = {
+        _case: _value["peak_bytes"] / _value["tile_bytes"]
+        for _case, _value in _result.items()
+        if "tile_bytes" in _value and "peak_bytes" in _value and (
+            _value["peak_bytes"] > _value["tile_bytes"] * TILED_MEMORY_RATE)
+    }
+    for _case, _rate in _unbounded.items():
+        print(f"!!! {_case} allocates {_rate:.0f} tiles")
+
+    if _arg.output is not None:
+        with open(_arg.output, "w", encoding="UTF-8") as _file:
+            json.dump(
+                {"meta": _bench.Get_meta(), "result": _result},
+                _file, indent=2)
+
+    if _arg.baseline is not None:
+        with open(_arg.baseline, "r", encoding="UTF-8") as _file:
+            _baseline = json.load(_file)["result"]
+
+        _regression = Benchmark.Compare(_result, _baseline, _arg.threshold)
+        for _case, _old, _new in _regression:
+            print(f"!!! {_case} is slower: {_old:.2f} ms -> {_new:.2f} ms")
+        sys.exit(
+            1 if _regression or _eager or _mismatch or _unbounded else 0)
+
+    sys.exit(1 if _eager or _mismatch or _unbounded else 0)
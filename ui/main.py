@@ -1,19 +1,21 @@
 from typing import Any
 
-from numpy import ndarray
+from numpy import ndarray, empty
 
-from PySide6.QtCore import Signal
+from PySide6.QtCore import Signal, QThreadPool
+from PySide6.QtGui import QCloseEvent
 from PySide6.QtWidgets import (
     QHBoxLayout, QVBoxLayout,
     QMainWindow,
     QWidget, QToolBar, QLayout, QGridLayout,
     QPushButton, QTableWidget, QTableWidgetItem, QHeaderView,
-    QTabWidget
+    QTabWidget, QProgressBar
     # QListWidgetItem
     # QMessageBox, QFileDialog, QDialog
 )
 
-from utils.image_process import Apply_Block
+from utils.image_process import Process, Apply_Block
+from utils.image_cache import Thumbnail_Cache, Result_Cache
 from ui.process import (
     Process_UI,
     Resize_Block, Crop, Flip_Block, Mask_Block,
@@ -22,17 +24,27 @@ from ui.process import (
 from ui.ui_utils.widget import (
     Horizontal_Line, Vertical_Line, Titled_Block,
     Custom_Basewidget, Image_Display_with_Dir_n_Table)
+from ui.ui_utils.worker import Process_Worker
 
 
 class Image_Process_Edit(Titled_Block):
     # signal
     Apply_process: Signal = Signal(list)
+    Cancel_process: Signal = Signal()
 
     def __init__(self, parent: QWidget | None = None) -> None:
+        self.apply_btn: QPushButton
+        self.cancel_btn: QPushButton
+        self.progress_bar: QProgressBar
+
         super().__init__("Image Process", (), parent)
 
         self.process_table: QTableWidget
         self.process_list = []
+        # "file name -> error" of the images failed in this run
+        self.failure_list: list[str] = []
+        # processed images when the run is cancelled (None: not cancelled)
+        self.cancelled_at: int | None = None
 
     def _Contents_init(self):
         _layout = QHBoxLayout()
@@ -87,14 +99,24 @@ class Image_Process_Edit(Titled_Block):
         _remove_btn.clicked.connect(self.Remove)
         _clear_btn = QPushButton("clear")
         _clear_btn.clicked.connect(self.Clear)
+        _progress_bar = QProgressBar(self)
+        _progress_bar.setFormat("%v / %m")
+        _cancel_btn = QPushButton("cancel")
+        _cancel_btn.setEnabled(False)
+        _cancel_btn.clicked.connect(self.Cancel)
 
         _table_layout.addWidget(_process_table, 0, 0, 4, 3)
         _table_layout.addWidget(_apply_btn, 4, 0)
         _table_layout.addWidget(_remove_btn, 4, 1)
         _table_layout.addWidget(_clear_btn, 4, 2)
+        _table_layout.addWidget(_progress_bar, 5, 0, 1, 2)
+        _table_layout.addWidget(_cancel_btn, 5, 2)
         _layout.addLayout(_table_layout, 3)
 
         self.process_table = _process_table
+        self.apply_btn = _apply_btn
+        self.cancel_btn = _cancel_btn
+        self.progress_bar = _progress_bar
 
         return _layout
 
@@ -113,6 +135,57 @@ class Image_Process_Edit(Titled_Block):
     def Apply(self):
         self.Apply_process.emit(self.process_list)
 
+    def Cancel(self):
+        self.cancel_btn.setEnabled(False)
+        self.Cancel_process.emit()
+
+    def Set_running(self, is_running: bool, total: int = 0):
+        self.apply_btn.setEnabled(not is_running)
+        self.cancel_btn.setEnabled(is_running)
+
+        if is_running:
+            self.failure_list = []
+            self.cancelled_at = None
+            self._Update_status()
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(0)
+
+    def Set_progress(self, done: int, total: int):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def Add_failure(self, file_name: str, message: str):
+        """
+        #### 실패한 이미지 수를 진행 막대에, 이름과 오류를 툴팁에 표시
+        ----------------------------------------------------------------
+        """
+        self.failure_list.append(f"{file_name} -> {message}")
+        self._Update_status()
+
+    def Set_cancelled(self, done: int):
+        self.cancelled_at = done
+        self._Update_status()
+
+    def _Update_status(self):
+        """
+        #### 진행 막대 글자 (실패 수, 취소 여부) 와 툴팁 (실패 목록) 갱신
+        ----------------------------------------------------------------
+        """
+        _failure_list = self.failure_list
+        _notes = []
+        _tips = _failure_list[-20:]
+        if _failure_list:
+            _notes.append(f"{len(_failure_list)} failed")
+        if self.cancelled_at is not None:
+            _notes.append("cancelled")
+            _tips = [
+                *_tips, f"cancelled after {self.cancelled_at} images"]
+
+        _progress_bar = self.progress_bar
+        _progress_bar.setFormat(
+            f"%v / %m ({', '.join(_notes)})" if _notes else "%v / %m")
+        _progress_bar.setToolTip("\n".join(_tips))
+
     def Remove(self):
         _table = self.process_table
         _process_list = self.process_list
@@ -147,8 +220,21 @@ class Image_Process_Edit(Titled_Block):
 
 
 class Image_File_Display(Custom_Basewidget):
+    # signal
+    is_started: Signal = Signal(bool, int)  # (is_running, total)
+    is_progressed: Signal = Signal(int, int)  # (done, total)
+    is_failed: Signal = Signal(str, str)  # (file_name, message)
+    is_cancelled: Signal = Signal(int)  # images done before the cancel
+
     def __init__(self, parent: QWidget | None = None, **kwarg) -> None:
         self.apply_blocks: list[Apply_Block] = []
+        # file name -> index of the block, shared by the input and output
+        self.block_index: dict[str, int] = {}
+        self.worker: Process_Worker | None = None
+        self.result_cache: Result_Cache | None = None
+        self._done_ct = 0
+        # index of the blocks failed in this run, their rows are not applied
+        self._failed: set[int] = set()
 
         self.input_ui: Image_Display_with_Dir_n_Table
         self.output_ui: Image_Display_with_Dir_n_Table
@@ -159,97 +245,210 @@ class Image_File_Display(Custom_Basewidget):
 
     def _User_interface_init(self) -> QLayout:
         _main_layout = QHBoxLayout()
+        _thumbnail_cache = Thumbnail_Cache()
+
         _input_ui = Image_Display_with_Dir_n_Table(
-            "input", ".\\data\\input", 500, self)
+            "input", ".\\data\\input", 500, self,
+            thumbnail_cache=_thumbnail_cache)
         _input_ui.is_refreshed.connect(self._Get_input_data)
+        _input_ui.is_changed.connect(self._Update_input_data)
         _main_layout.addWidget(_input_ui, 99)
 
         _main_layout.addWidget(Vertical_Line(), 1)
 
         _output_ui = Image_Display_with_Dir_n_Table(
-            "output", ".\\data\\output", 500, self)
+            "output", ".\\data\\output", 500, self,
+            thumbnail_cache=_thumbnail_cache)
         _output_ui.is_refreshed.connect(self._Get_output_data)
+        _output_ui.is_changed.connect(self._Update_output_data)
         _main_layout.addWidget(_output_ui, 99)
 
         self.input_ui = _input_ui
         self.output_ui = _output_ui
 
-        _input_table = _input_ui.file_table_widget
+        _input_ui.is_selected.connect(self._Select_the_input_img)
+        _input_ui.is_activated.connect(self._Call_process_page)
         _input_ui.Refresh()
-        _input_table.currentCellChanged.connect(self._Select_the_input_img)
-        _input_table.cellDoubleClicked.connect(self._Call_process_page)
+        _output_ui.is_selected.connect(self._Select_the_output_img)
+        _output_ui.is_activated.connect(self._Call_process_page)
         _output_ui.Refresh()
-        _output_table = _output_ui.file_table_widget
-        _output_table.currentCellChanged.connect(self._Select_the_output_img)
-        _output_table.cellDoubleClicked.connect(self._Call_process_page)
 
         return _main_layout
 
     def _Get_input_data(
         self,
-        data: list[tuple[str, ndarray]]
+        data: list[tuple[str, ndarray | str]]
     ):
         _save_dir = self.output_ui.file_dir
+        _result_cache = Result_Cache(_save_dir)
 
+        self.result_cache = _result_cache
         self.apply_blocks = [
             Apply_Block(
-                _save_dir, _file_name, _img) for _file_name, _img in data
+                _save_dir, _file_name, _img, result_cache=_result_cache
+            ) for _file_name, _img in data
         ]
+        self._Reindex_blocks()
 
     def _Get_output_data(
         self,
-        data: list[tuple[str, ndarray]]
+        data: list[tuple[str, ndarray | str]]
     ):
-        _apply_list = self.apply_blocks
-        _apply_ids = list(range(len(_apply_list)))
-        _data_ids = list(range(len(data)))
+        """
+        #### 결과 파일을 이름으로 처리 블록에 연결하고, 입력이 없는 행은 삭제
+        ----------------------------------------------------------------
+        """
+        _blocks = self.apply_blocks
+        _index = self.block_index
+        _orphan_rows = []
+
+        for _row, (_file_name, _img) in enumerate(data):
+            _ct = _index.get(_file_name)
+            if _ct is None:
+                _orphan_rows.append(_row)
+            else:
+                _blocks[_ct].output_img = _img
 
-        _rm_ct = 0
+        self.output_ui.Remove(_orphan_rows)
 
-        for _data_ct, (_file_name, _img) in enumerate(data):
-            for _apply_ct, _apply_id in enumerate(_apply_ids):
-                _this_block = _apply_list[_apply_id]
+    def _Reindex_blocks(self):
+        self.block_index = {
+            _block.file_name: _ct
+            for _ct, _block in enumerate(self.apply_blocks)
+        }
 
-                if _this_block.file_name == _file_name:
-                    _this_block.output_img = _img
+    def _Get_block(self, file_name: str | None) -> Apply_Block | None:
+        _ct = self.block_index.get(file_name) if file_name else None
+        return None if _ct is None else self.apply_blocks[_ct]
 
-                    _apply_ids.pop(_apply_ct)
-                    _data_ids.pop(_data_ct - _rm_ct)
-                    _rm_ct += 1
-                    break
+    def _Update_input_data(
+        self,
+        added: list[tuple[str, ndarray | str]],
+        removed: list[str],
+        modified: list[tuple[str, ndarray | str]]
+    ):
+        """
+        #### 입력 디렉토리에서 바뀐 파일의 처리 블록만 갱신
+        ----------------------------------------------------------------
+        행과 블록의 순서를 맞추기 위해 표와 같은 순서로 지우고 추가
+        """
+        _blocks = self.apply_blocks
+        _index = self.block_index
+
+        _removed = {_index[_name] for _name in removed if _name in _index}
+        if _removed:
+            _blocks[:] = [
+                _block for _ct, _block in enumerate(_blocks)
+                if _ct not in _removed
+            ]
+            self._Reindex_blocks()
+
+        _index = self.block_index
+        for _file_name, _img in modified:
+            if isinstance(_img, str):  # drop the decoded old one
+                Apply_Block.image_cache.Pop(_img)
+            if _file_name in _index:
+                _blocks[_index[_file_name]].input_img = _img  # steps are stale
 
-        self.output_ui.Remove(_data_ids)
+        _save_dir = self.output_ui.file_dir
+        _result_cache = self.result_cache
+        for _file_name, _img in added:
+            _index[_file_name] = len(_blocks)
+            _blocks.append(Apply_Block(
+                _save_dir, _file_name, _img, result_cache=_result_cache))
 
-    def _Select_the_input_img(self, row: int):
-        _input_widget = self.input_ui.img_widget
-        _pick_img = self.apply_blocks[row].input_img
+    def _Update_output_data(
+        self,
+        added: list[tuple[str, ndarray | str]],
+        removed: list[str],
+        modified: list[tuple[str, ndarray | str]]
+    ):
+        _blocks = self.apply_blocks
+        _index = self.block_index
 
-        if row >= 0 and len(_pick_img.shape) >= 2:
-            _input_widget.Set_img(_pick_img)
+        for _file_name, _img in added + modified:
+            if isinstance(_img, str):
+                Apply_Block.image_cache.Pop(_img)
+            if _file_name in _index:
+                _blocks[_index[_file_name]].output_img = _img
 
-            _output_table = self.output_ui.file_table_widget
-            if _output_table.rowCount() >= (row + 1):
-                _output_table.setCurrentCell(row, 0)
-        else:
-            _input_widget.clear()
+        for _file_name in removed:
+            if _file_name in _index:
+                _blocks[_index[_file_name]].output_img = empty(0)
 
-    def _Select_the_output_img(self, row: int):
-        _output_widget = self.output_ui.img_widget
-        _pick_img = self.apply_blocks[row].output_img
+    def _Select_the_input_img(self, file_name: str):
+        _input_ui = self.input_ui
+        _block = self._Get_block(file_name)
 
-        if row >= 0 and len(_pick_img.shape) >= 2:
-            _output_widget.Set_img(_pick_img)
-        else:
-            _output_widget.clear()
+        if _block is None:
+            _input_ui.img_widget.clear()
+            return
 
-    def Get_process_info(self, process_arg_list: list[dict]):
-        for _block in self.apply_blocks:
-            _block.Set_process(process_arg_list)
-            _block()
+        if _input_ui.Show(_block.input_file or _block.input_img):
+            # the row of the same file, wherever it is in the sorted view
+            self.output_ui.Select(file_name)
 
-        self.output_ui.Refresh()
+    def _Select_the_output_img(self, file_name: str):
+        _output_ui = self.output_ui
+        _block = self._Get_block(file_name)
 
-    def _Call_process_page(self):
+        if _block is None:
+            _output_ui.img_widget.clear()
+        else:
+            _output_ui.Show(_block.output_file or _block.output_img)
+
+    def Get_process_info(self, process_arg_list: list[dict]):
+        if self.worker is not None:  # one batch at a time
+            return
+
+        _worker = Process_Worker(
+            self.apply_blocks, process_arg_list, self.result_cache)
+        _signal = _worker.signal
+        _signal.is_progressed.connect(self._Update_progress)
+        _signal.is_failed.connect(self._Report_failure)
+        _signal.is_finished.connect(self._Finish_process)
+
+        self.worker = _worker
+        self._done_ct = 0
+        self._failed = set()
+        self.is_started.emit(True, len(_worker.apply_blocks))
+
+        QThreadPool.globalInstance().start(_worker)
+
+    def _Update_progress(self, index: int, total: int, file_name: str):
+        _worker = self.worker
+        if _worker is None:
+            return
+
+        _block = _worker.apply_blocks[index]
+        _shape = None if (
+            index in self._failed) else _block.Get_output_shape()
+        if _shape is not None:
+            self.output_ui.Update_row(file_name, _shape)
+            self.input_ui.Update_row(file_name)
+
+        self._done_ct += 1
+        self.is_progressed.emit(self._done_ct, total)
+
+    def _Report_failure(self, index: int, file_name: str, message: str):
+        # emitted before is_progressed of the same image
+        self._failed.add(index)
+        self.is_failed.emit(file_name, message)
+
+    def _Finish_process(self, done: int, is_cancelled: bool):
+        self.worker = None
+        self.is_started.emit(False, 0)
+        if is_cancelled:
+            self.is_cancelled.emit(done)
+
+        if not self.output_ui.watch_timer.isActive():
+            self.output_ui.Refresh()  # the watcher updates the rows instead
+
+    def Cancel(self):
+        if self.worker is not None:
+            self.worker.Cancel()
+
+    def _Call_process_page(self, file_name: str):
         ...
 
 
@@ -293,7 +492,21 @@ class Main_Page(QMainWindow):
 
         _img_process_edit.Apply_process.connect(
             _file_dis_display.Get_process_info)
+        _img_process_edit.Cancel_process.connect(_file_dis_display.Cancel)
+        _file_dis_display.is_started.connect(_img_process_edit.Set_running)
+        _file_dis_display.is_progressed.connect(
+            _img_process_edit.Set_progress)
+        _file_dis_display.is_failed.connect(_img_process_edit.Add_failure)
+        _file_dis_display.is_cancelled.connect(
+            _img_process_edit.Set_cancelled)
 
         self.img_display = _file_dis_display
 
         return _main_widget
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        # stop between images instead of leaving a worker behind
+        self.img_display.Cancel()
+        QThreadPool.globalInstance().waitForDone()
+        Process.writer.Close()
+        return super().closeEvent(event)
@@ -8,6 +8,8 @@ from PySide6.QtWidgets import (
     # QMessageBox, QFileDialog, QDialog
 )
 
+from utils.image_process import Process
+
 from .ui_utils.widget import (
     Num_edit, Titled_Block, Labeling
 )
@@ -65,10 +67,10 @@ class Resize_Block(Process_UI):
                 Labeling("h: ", [_h_size_edit, QLabel("px")], space_rate=0)
             ]
         )
-        # resize - interpolation  !!! not yet !!!
+        # resize - interpolation (auto: linear to enlarge, area to shrink)
         _inter_combo = QComboBox(self)
-        _inter_combo.setEnabled(False)
-        _inter_layout = Labeling("interpolation\n(Not Yet)", [_inter_combo, ])
+        _inter_combo.addItems(["auto", *Process.Resize.INTERPOLATION])
+        _inter_layout = Labeling("interpolation", [_inter_combo, ])
 
         _layout = QVBoxLayout()
         _layout.addLayout(_pose_layer)
@@ -87,7 +89,7 @@ class Resize_Block(Process_UI):
                 "arg": {
                     "height": self.h_size_edit.value,
                     "width": self.w_size_edit.value,
-                    "interpolation": self.interpolation_combo.currentIndex()
+                    "interpolation": self.interpolation_combo.currentText()
                 }
             }
         )
@@ -212,8 +214,14 @@ class Mask_Block(Process_UI):
 
 
 class Background_Block(Process_UI):
+    model_list = [
+        "default", "u2net", "u2netp", "u2net_human_seg",
+        "isnet-general-use", "silueta"
+    ]
+
     def __init__(self, parent: QWidget | None = None) -> None:
         self.mode_combobox: QComboBox
+        self.model_combobox: QComboBox
         self.positive_check: QCheckBox
         super().__init__("Background", parent)
 
@@ -224,21 +232,30 @@ class Background_Block(Process_UI):
         _rotate_layer = Labeling(
             "masking option", [_auto_masking, _positive_check])
 
+        _model_combo = QComboBox(self)
+        _model_combo.addItems(self.model_list)
+        _model_layer = Labeling("model", [_model_combo, ])
+
         _layout = QVBoxLayout()
         _layout.addLayout(_rotate_layer)
+        _layout.addLayout(_model_layer)
 
         self.mode_combobox = _auto_masking
+        self.model_combobox = _model_combo
         self.positive_check = _positive_check
 
         return _layout
 
     def Add(self):
+        _model = self.model_combobox.currentText()
+
         self.Add_process.emit(
             {
                 "process": "Background_Masking",
                 "arg": {
                     "mode": self.mode_combobox.currentText(),
-                    "is_positive": self.positive_check.isChecked()
+                    "is_positive": self.positive_check.isChecked(),
+                    "model_name": None if _model == "default" else _model
                 }
             }
         )
@@ -0,0 +1,311 @@
+from array import array
+from typing import Any, Callable
+
+from PySide6.QtCore import (
+    Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex,
+    QPersistentModelIndex
+)
+
+
+_Index = QModelIndex | QPersistentModelIndex
+
+
+class File_Table_Model(QAbstractTableModel):
+    """ ### 파일 정보 (이름, 크기, 적용 여부) 를 열 단위로 보관하는 표 모델
+
+    행마다 항목 객체를 만들지 않고, 화면에 보이는 칸만 `data` 로 만든다.
+    정렬은 열 배열을 직접 재배치하고, 검색은 `File_Filter_Proxy` 가 한다.
+
+    ---------------------------------------------------------------------------
+    """
+    HEADER = ("file", "size", "is_applied")
+    # scattered rows over this many ranges are removed by a model reset
+    MAX_REMOVE_RANGES = 64
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+
+        # one array per column, -1: unknown size
+        self.names: list[str] = []
+        self.heights = array("i")
+        self.widths = array("i")
+        self.applied = bytearray()
+
+        # file name -> row
+        self.row_index: dict[str, int] = {}
+
+        # -1: the order of insertion
+        self.sort_column = -1
+        self.sort_order = Qt.SortOrder.AscendingOrder
+
+    def rowCount(self, parent: _Index = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.names)
+
+    def columnCount(self, parent: _Index = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADER)
+
+    def headerData(
+        self,
+        section: int,
+        orientation: Qt.Orientation,
+        role: int = Qt.ItemDataRole.DisplayRole
+    ) -> Any:
+        if role == Qt.ItemDataRole.DisplayRole and (
+            orientation == Qt.Orientation.Horizontal
+        ):
+            return self.HEADER[section]
+        return None
+
+    def data(
+        self, index: _Index, role: int = Qt.ItemDataRole.DisplayRole
+    ) -> Any:
+        if not index.isValid():
+            return None
+        _row, _col = index.row(), index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if _col == 0:
+                return self.names[_row]
+            if _col == 1:
+                _h = self.heights[_row]
+                return "-" if _h < 0 else f"{_h}, {self.widths[_row]}"
+            return str(bool(self.applied[_row]))
+        return None
+
+    def _Get_sort_key(self, column: int) -> Callable[[int], Any]:
+        if column == 0:
+            return self.names.__getitem__
+        if column == 1:  # area, unknown size first
+            _heights, _widths = self.heights, self.widths
+            return lambda _row: _heights[_row] * max(_widths[_row], 0)
+        return self.applied.__getitem__
+
+    def _Reorder(self, order: list[int]):
+        self.names = [self.names[_row] for _row in order]
+        self.heights = array("i", (self.heights[_row] for _row in order))
+        self.widths = array("i", (self.widths[_row] for _row in order))
+        self.applied = bytearray(self.applied[_row] for _row in order)
+        self.row_index = {
+            _name: _ct for _ct, _name in enumerate(self.names)}
+
+    def _Reindex(self, first: int, last: int):
+        """ first ~ last 행의 이름만 다시 색인 (끝 포함) """
+        _row_index = self.row_index
+        for _ct in range(first, last + 1):
+            _row_index[self.names[_ct]] = _ct
+
+    def _Get_order(self) -> list[int]:
+        return sorted(
+            range(len(self.names)),
+            key=self._Get_sort_key(self.sort_column),
+            reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+
+    def sort(
+        self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder
+    ):
+        """
+        #### 열 값으로 행 재배치 (proxy 대신 여기서 한 번에 정렬)
+        ----------------------------------------------------------------
+        """
+        self.sort_column = column
+        self.sort_order = order
+        if column < 0 or not self.names:
+            return
+
+        self.layoutAboutToBeChanged.emit()
+        _order = self._Get_order()
+        _new_rows = [0] * len(_order)
+        for _new, _old in enumerate(_order):
+            _new_rows[_old] = _new
+        self._Reorder(_order)
+
+        # keep the current and selected rows of the view
+        _old_list = self.persistentIndexList()
+        self.changePersistentIndexList(_old_list, [
+            self.index(_new_rows[_index.row()], _index.column())
+            for _index in _old_list
+        ])
+        self.layoutChanged.emit()
+
+    def _Get_sort_value(
+        self,
+        file_name: str,
+        shape: tuple[int, ...] | None,
+        is_applied: bool
+    ) -> Any:
+        """ 아직 없는 행의 정렬 값 (`_Get_sort_key` 와 같은 값) """
+        _column = self.sort_column
+        if _column == 0:
+            return file_name
+        if _column == 1:
+            return -1 if shape is None else shape[0] * max(shape[1], 0)
+        return int(is_applied)
+
+    def _Find_insert_row(self, value: Any, skip: int = -1) -> int:
+        """
+        #### 정렬 값이 value 인 행이 들어갈 위치 (이분 탐색)
+        ----------------------------------------------------------------
+        skip 행은 없는 것으로 보고 찾음 (옮길 행)
+        """
+        _len = len(self.names) - (skip >= 0)
+        if self.sort_column < 0:
+            return _len
+
+        _key = self._Get_sort_key(self.sort_column)
+        _is_descending = self.sort_order == Qt.SortOrder.DescendingOrder
+
+        # after the equal ones, same as a stable sort
+        _low, _high = 0, _len
+        while _low < _high:
+            _mid = (_low + _high) // 2
+            _mid_value = _key(_mid + (0 <= skip <= _mid))
+            if (value > _mid_value) if _is_descending else (
+                value < _mid_value
+            ):
+                _high = _mid
+            else:
+                _low = _mid + 1
+        return _low
+
+    def Reset(
+        self,
+        names: list[str],
+        shapes: list[tuple[int, ...] | None],
+        is_applied: bool = False
+    ):
+        """
+        #### 모든 행을 한 번에 교체
+        ----------------------------------------------------------------
+        """
+        self.beginResetModel()
+        self.names = list(names)
+        self.heights = array("i", (
+            -1 if _shape is None else _shape[0] for _shape in shapes))
+        self.widths = array("i", (
+            -1 if _shape is None else _shape[1] for _shape in shapes))
+        self.applied = bytearray([is_applied]) * len(names)
+        if self.sort_column < 0:
+            self.row_index = {
+                _name: _ct for _ct, _name in enumerate(self.names)}
+        else:
+            self._Reorder(self._Get_order())
+        self.endResetModel()
+
+    def Find_row(self, file_name: str) -> int | None:
+        return self.row_index.get(file_name)
+
+    def Get_file_name(self, row: int) -> str | None:
+        return self.names[row] if 0 <= row < len(self.names) else None
+
+    def Update_row(
+        self,
+        file_name: str,
+        shape: tuple[int, ...] | None = None,
+        is_applied: bool | None = True
+    ) -> int:
+        """
+        #### 파일 이름이 같은 행을 갱신하고, 없으면 정렬 위치에 추가
+        ----------------------------------------------------------------
+        is_applied 가 None 이면 있던 행의 적용 여부는 그대로 (새 행은 False)
+        """
+        _row = self.row_index.get(file_name)
+
+        if _row is None:
+            is_applied = bool(is_applied)
+            _row = self._Find_insert_row(
+                self._Get_sort_value(file_name, shape, is_applied))
+            self.beginInsertRows(QModelIndex(), _row, _row)
+            self.names.insert(_row, file_name)
+            self.heights.insert(_row, -1 if shape is None else shape[0])
+            self.widths.insert(_row, -1 if shape is None else shape[1])
+            self.applied.insert(_row, is_applied)
+            self._Reindex(_row, len(self.names) - 1)  # the rows after shift
+            self.endInsertRows()
+            return _row
+
+        if shape is not None:
+            self.heights[_row] = shape[0]
+            self.widths[_row] = shape[1]
+        if is_applied is not None:
+            self.applied[_row] = is_applied
+        self.dataChanged.emit(self.index(_row, 1), self.index(_row, 2))
+
+        if self.sort_column > 0:  # the sorted value may have changed
+            _row = self._Move_row(_row)
+        return _row
+
+    def _Move_row(self, row: int) -> int:
+        """
+        #### 값이 바뀐 행을 정렬 위치로 옮김 (이분 탐색이 맞도록)
+        ----------------------------------------------------------------
+        """
+        _to = self._Find_insert_row(
+            self._Get_sort_key(self.sort_column)(row), row)
+        if _to == row:
+            return row
+
+        # destination is the row before the move, below the moved one
+        self.beginMoveRows(
+            QModelIndex(), row, row, QModelIndex(),
+            _to + 1 if _to > row else _to)
+        for _column in (self.names, self.heights, self.widths, self.applied):
+            _value = _column.pop(row)
+            _column.insert(_to, _value)
+        self._Reindex(min(row, _to), max(row, _to))
+        self.endMoveRows()
+        return _to
+
+    def Remove(self, rows: list[int]):
+        """
+        #### 행 삭제 (연속된 행은 한 번에)
+        ----------------------------------------------------------------
+        """
+        _rows = sorted(set(rows), reverse=True)
+        if not _rows:
+            return
+
+        _ranges: list[tuple[int, int]] = []
+        for _row in _rows:
+            if _ranges and _ranges[-1][0] == _row + 1:
+                _ranges[-1] = (_row, _ranges[-1][1])
+            else:
+                _ranges.append((_row, _row))
+
+        if len(_ranges) > self.MAX_REMOVE_RANGES:  # one reset is cheaper
+            _removed = set(_rows)
+            self.beginResetModel()
+            self._Reorder([
+                _row for _row in range(len(self.names))
+                if _row not in _removed
+            ])
+            self.endResetModel()
+            return
+
+        for _first, _last in _ranges:  # from the bottom, rows stay valid
+            self.beginRemoveRows(QModelIndex(), _first, _last)
+            for _column in (self.names, self.heights, self.widths):
+                del _column[_first:_last + 1]
+            del self.applied[_first:_last + 1]
+            self.endRemoveRows()
+
+        self.row_index = {
+            _name: _ct for _ct, _name in enumerate(self.names)}
+
+
+class File_Filter_Proxy(QSortFilterProxyModel):
+    """ ### 파일 표의 이름 검색 (대소문자 무시)
+
+    정렬은 원본 모델에 넘긴다. proxy 가 정렬하면 비교할 때마다 `data` 를
+    불러서 행이 많으면 느리다.
+    """
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.setFilterKeyColumn(0)
+        self.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+
+    def sort(
+        self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder
+    ):
+        _source = self.sourceModel()
+        if _source is not None:
+            _source.sort(column, order)
@@ -1,18 +1,23 @@
 import numpy as np
 import cv2
 
-from PySide6.QtCore import Signal, Qt
+from PySide6.QtCore import Signal, Qt, QTimer, QModelIndex, QThreadPool
 from PySide6.QtGui import QPixmap, QImage
 
 from PySide6.QtWidgets import (
     QWidget, QLabel, QFrame,
     QLayout, QHBoxLayout, QVBoxLayout,
     QLineEdit, QPushButton,
-    QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog
+    QTableView, QAbstractItemView, QHeaderView, QFileDialog
 )
 
 from utils.system import Path
 from utils.image_process import Process
+from utils.image_cache import Thumbnail_Cache
+from utils.dir_watcher import Directory_Watcher
+from utils.trace import Tracer
+from .file_table import File_Table_Model, File_Filter_Proxy
+from .worker import Watch_Signal, Watch_Worker
 
 
 class Horizontal_Line(QFrame):
@@ -132,6 +137,16 @@ class Image_Viewer(QLabel):
     # signal
     is_init_fail: Signal = Signal(int)
 
+    # channel -> format of the opencv memory order, no channel swap
+    # (ARGB32 is B, G, R, A in memory on little endian machines)
+    FORMAT = {
+        1: QImage.Format.Format_Grayscale8,
+        3: QImage.Format.Format_BGR888,
+        4: QImage.Format.Format_ARGB32
+    }
+    # dtypes that cv2.resize shrinks with INTER_AREA
+    RESIZABLE = (np.uint8, np.uint16, np.int16, np.float32, np.float64)
+
     def __init__(
         self,
         img: np.ndarray | str | None = None,
@@ -155,47 +170,74 @@ class Image_Viewer(QLabel):
         return cv2.imread(img_file, cv2.IMREAD_UNCHANGED)
 
     @staticmethod
-    def _Img_converter(img: np.ndarray, flag: str = "BGR2RGB") -> np.ndarray:
-        if flag == "BGR2RGB":
-            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        if flag == "RGB2BGR":
-            return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-        if flag == "BGRA2RGBA":
-            return cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
-        if flag == "RGBA2BGRA":
-            return cv2.cvtColor(img, cv2.COLOR_RGBA2BGRA)
-        raise ValueError(F"flag '{flag}' is not suit able")
-
-    def _Img_to_pixmap(self, img: np.ndarray):
-        _h, _w = img.shape[:2]
+    def _To_uint8(img: np.ndarray) -> np.ndarray:
+        """
+        #### 표시용 8 bit 변환
+        ----------------------------------------------------------------
+        16 bit 는 전체 범위, 0 ~ 1 사이의 실수는 그대로 255 배,
+        나머지는 최소 ~ 최대 값을 0 ~ 255 로 늘린다.
+        """
+        _dtype = img.dtype
+        if _dtype == np.uint8:
+            return img
+        if _dtype == np.uint16:
+            return cv2.convertScaleAbs(img, alpha=255 / 65535)
+
+        if np.issubdtype(_dtype, np.floating):
+            if not np.isfinite(img).all():
+                img = np.nan_to_num(img, nan=0.0, posinf=0.0, neginf=0.0)
+            if img.min() >= 0 and img.max() <= 1:
+                return cv2.convertScaleAbs(img, alpha=255)
+        return cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+    def _Img_to_pixmap(self, img: np.ndarray) -> QPixmap | None:
+        """
+        #### 표시 크기로 줄이고 8 bit 로 바꾼 배열을 복사 없이 QPixmap 으로
+        ----------------------------------------------------------------
+        줄이는 것은 두 번에 나눈다. 정수 배율의 INTER_AREA 는 빠른 경로라
+        원본 전체는 이 한 번만 읽고, 남은 소수 배율은 이미 작아진 이미지에서
+        정확한 크기로 맞춘다 (원본에 바로 소수 배율 INTER_AREA 는 두 배 넘게 느림).
+        """
+        if img.size == 0:
+            return None
+        if img.ndim == 3 and img.shape[-1] == 1:
+            img = img[..., 0]
+        _channel = 1 if img.ndim == 2 else img.shape[-1]
+        if _channel not in self.FORMAT:
+            return None
+
+        if img.dtype not in self.RESIZABLE:  # bool, int32, float16, ...
+            img = img.astype(np.float32)
 
+        _h, _w = img.shape[:2]
         _limit = self.shape_limit
 
-        if (_limit > 0) and max(_h, _w) > self.shape_limit:
-            _v = self.shape_limit
+        if (_limit > 0) and max(_h, _w) > _limit:
+            _src_h, _src_w = _h, _w
             if _h > _w:
-                _h, _w = _v, round(_w * _v / _h)
+                _h, _w = _limit, max(round(_w * _limit / _h), 1)
             else:
-                _h, _w = round(_h * _v / _w), _v
-
-            img = cv2.resize(img, [_w, _h])
-
-        if len(img.shape) == 2:  # gray
-            _v = _w * 1
-            if img.dtype == np.uint8:
-                _format = QImage.Format.Format_Grayscale8
-            else:
-                _format = QImage.Format.Format_Grayscale16
-        elif img.shape[-1] == 3:  # color
-            _v = _w * 3
-            img = self._Img_converter(img)
-            _format = QImage.Format.Format_RGB888
-        else:  # color with a channel
-            _v = _w * 4
-            img = self._Img_converter(img, "BGRA2RGBA")
-            _format = QImage.Format.Format_RGBA8888
-
-        return QPixmap(QImage(img.data, _w, _h, _v, _format))
+                _h, _w = max(round(_h * _limit / _w), 1), _limit
+
+            # area averaging does not alias when shrinking. an integer
+            # scale takes the fast path of INTER_AREA, so only one pass
+            # over the full image and a small fix to the exact size
+            _scale = min(_src_h // _h, _src_w // _w)
+            if _scale > 1:
+                img = cv2.resize(
+                    img, None, fx=1 / _scale, fy=1 / _scale,
+                    interpolation=cv2.INTER_AREA)
+            if img.shape[:2] != (_h, _w):
+                img = cv2.resize(
+                    img, [_w, _h], interpolation=cv2.INTER_AREA)
+
+        # tone map after the resize, on the smaller image
+        img = np.ascontiguousarray(self._To_uint8(img))
+
+        # QImage only points at the array, fromImage copies the pixels
+        # while the array is still alive
+        return QPixmap.fromImage(QImage(
+            img.data, _w, _h, img.strides[0], self.FORMAT[_channel]))
 
     def Set_img(self, img: np.ndarray | str | None = None) -> bool:
         if img is not None:
@@ -203,8 +245,10 @@ class Image_Viewer(QLabel):
             _img: np.ndarray = self._Read_file(img) if _is_file else img
 
             # set image
-            if len(_img.shape) in [2, 3, 4]:  # gray, color, with alpha
-                self.setPixmap(self._Img_to_pixmap(_img))
+            _pixmap = None if _img is None or _img.ndim not in [2, 3] else (
+                self._Img_to_pixmap(_img))
+            if _pixmap is not None:  # gray, color, with alpha
+                self.setPixmap(_pixmap)
                 return True
 
             self.is_init_fail.emit(1)  # image data has problem
@@ -214,25 +258,53 @@ class Image_Viewer(QLabel):
 
 
 class Image_Display_with_Dir_n_Table(Titled_Block):
-    is_refreshed = Signal(list)  # (file_name, image)
+    is_refreshed = Signal(list)  # (file_name, image or file path)
+    # (added (file_name, image or path), removed file_name, modified (...))
+    is_changed = Signal(list, list, list)
+    is_selected = Signal(str)  # file name of the current row ("": none)
+    is_activated = Signal(str)  # file name of the double clicked row
 
     def __init__(
         self,
         data_type: str,
         default_dir: str,
         img_shape_limit: int,
-        parent: QWidget | None = None
+        parent: QWidget | None = None,
+        is_lazy: bool = True,
+        thumbnail_cache: Thumbnail_Cache | None = None,
+        watch_interval: int = 2000
     ) -> None:
         if Path.Exist_check(default_dir, Path.Type.DIR):
             self.file_dir: str = default_dir
         else:
             self.file_dir: str = Path.WORK_SPACE
 
+        # lazy: read only the image size from the file header,
+        # and hand over the file path instead of the decoded image
+        self.is_lazy = is_lazy
+        self.thumbnail_cache = thumbnail_cache
+
+        self.watcher = Directory_Watcher(self.file_dir, ["jpg", "png"])
+        # one poll at a time on the thread pool, a refresh bumps the epoch
+        self._watch_epoch = 0
+        self._is_polling = False
+
         super().__init__(data_type, ["Set directory", "Refresh"], parent)
 
         self.img_widget: Image_Viewer
         self.img_widget.shape_limit = img_shape_limit
-        self.file_table_widget: QTableWidget
+        self.file_table: QTableView
+        self.file_model: File_Table_Model
+        self.file_proxy: File_Filter_Proxy
+
+        self.watch_signal = Watch_Signal(self)
+        self.watch_signal.is_polled.connect(self._Apply_changes)
+
+        # poll the directory and update only the changed rows (ms, 0: off)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.timeout.connect(self.Watch)
+        if watch_interval > 0:
+            self.watch_timer.start(watch_interval)
 
     def _Title_init(
             self, title: str, process_btn: tuple[str, ...]) -> QHBoxLayout:
@@ -260,33 +332,81 @@ class Image_Display_with_Dir_n_Table(Titled_Block):
         _layout = QVBoxLayout()
         _layout.setContentsMargins(0, 0, 0, 0)
 
-        _file_info_list = [
-            "file", "size", "is_applied"
-        ]
-        _len_info = len(_file_info_list)
-        _file_table_widget = QTableWidget(self)
-        _file_table_widget.verticalHeader().setVisible(False)
-        _file_table_widget.setColumnCount(_len_info)
-        _ = [
-            _file_table_widget.horizontalHeader().setSectionResizeMode(
-                _ct, QHeaderView.ResizeMode.Stretch if (
-                    not _ct
-                ) else QHeaderView.ResizeMode.ResizeToContents
-            ) for _ct in range(_len_info)
-        ]
-        _file_table_widget.setHorizontalHeaderLabels(_file_info_list)
-        _file_table_widget.setEditTriggers(
-            QTableWidget.EditTrigger.NoEditTriggers)
-        _layout.addWidget(_file_table_widget, 2)
+        # columnar model, the view asks only for the visible cells
+        _file_model = File_Table_Model(self)
+        _file_proxy = File_Filter_Proxy(self)
+        _file_proxy.setSourceModel(_file_model)
+
+        _filter_edit = QLineEdit(self)
+        _filter_edit.setPlaceholderText("filter by file name")
+        _filter_edit.textChanged.connect(_file_proxy.setFilterFixedString)
+        _layout.addWidget(_filter_edit)
+
+        _file_table = QTableView(self)
+        _file_table.setModel(_file_proxy)
+        _file_table.setSortingEnabled(True)
+        _file_table.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+        _file_table.setEditTriggers(
+            QAbstractItemView.EditTrigger.NoEditTriggers)
+        _file_table.setSelectionBehavior(
+            QAbstractItemView.SelectionBehavior.SelectRows)
+        _file_table.setSelectionMode(
+            QAbstractItemView.SelectionMode.SingleSelection)
+
+        # fixed sizes, fitting to contents would visit every row
+        _vertical_header = _file_table.verticalHeader()
+        _vertical_header.setVisible(False)
+        _vertical_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        _header = _file_table.horizontalHeader()
+        _header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for _ct in range(1, _file_model.columnCount()):
+            _header.setSectionResizeMode(
+                _ct, QHeaderView.ResizeMode.Interactive)
+            _header.resizeSection(_ct, 90)
+
+        _file_table.selectionModel().currentRowChanged.connect(
+            self._Current_changed)
+        _file_table.doubleClicked.connect(
+            lambda _index: self.is_activated.emit(
+                self._Get_name_at(_index) or ""))
+        _layout.addWidget(_file_table, 2)
 
         _img_widget = Image_Viewer()
         _layout.addWidget(_img_widget, 3)
 
         self.img_widget = _img_widget
-        self.file_table_widget = _file_table_widget
+        self.file_table = _file_table
+        self.file_model = _file_model
+        self.file_proxy = _file_proxy
 
         return _layout
 
+    def _Get_name_at(self, index: QModelIndex) -> str | None:
+        if not index.isValid():
+            return None
+        return self.file_model.Get_file_name(
+            self.file_proxy.mapToSource(index).row())
+
+    def _Current_changed(self, current: QModelIndex, previous: QModelIndex):
+        self.is_selected.emit(self._Get_name_at(current) or "")
+
+    def Select(self, file_name: str | None):
+        """
+        #### 파일 이름으로 행 선택 (None 이거나 없는 파일이면 선택 해제)
+        ----------------------------------------------------------------
+        """
+        _row = None if file_name is None else self.Find_row(file_name)
+        _index = QModelIndex() if _row is None else (
+            self.file_proxy.mapFromSource(self.file_model.index(_row, 0)))
+
+        _table = self.file_table
+        if _index.isValid():
+            _table.setCurrentIndex(_index)
+            _table.scrollTo(_index)
+        else:
+            _table.selectionModel().clear()
+            self._Current_changed(_index, _index)
+
     def Set_directory(self):
         _dir_type = self.title_label.text()
         _new_dir = QFileDialog.getExistingDirectory(
@@ -295,48 +415,156 @@ class Image_Display_with_Dir_n_Table(Titled_Block):
         self.file_dir = _new_dir
         self.Refresh()
 
+    def _Read_row_data(
+        self, file_path: str
+    ) -> tuple[np.ndarray | str, tuple[int, ...] | None]:
+        if self.is_lazy:
+            return file_path, Process.Read_shape(file_path)
+
+        _img = Process.Read(file_path)
+        return (np.empty(0), None) if _img is None else (_img, _img.shape[:2])
+
     def Refresh(self):  # read file in directory
-        _default_dir = self.file_dir
-        _new_files = Path.Search(
-            _default_dir, Path.Type.FILE, ext_filter=["jpg", "png"])
+        with Tracer.Span("Refresh", "ui", self.file_dir):
+            self._Refresh()
 
-        _table = self.file_table_widget
-        _table.clearContents()
-        _table.setRowCount(len(_new_files))
+    def _Refresh(self):
+        _default_dir = self.file_dir
+        _watcher = self.watcher
+        _watcher.obj_dir = _default_dir
+        self._watch_epoch += 1  # a poll running now is for the old state
+
+        # one scan for both the table and the watcher
+        _snapshot = _watcher.Scan()
+        _watcher.Reset(_snapshot)
+        _new_files = [
+            Path.Join(_file_name, _default_dir)
+            for _file_name in sorted(_snapshot)
+        ]
 
         _read_data = []
+        _names: list[str] = []
+        _shapes: list[tuple[int, ...] | None] = []
 
-        for _ct, _file in enumerate(_new_files):
+        for _file in _new_files:
             _file_name = Path.Get_file_directory(_file)[-1]
+            _img, _shape = self._Read_row_data(_file)
 
-            _img = Process.Read(_file)
-            _shape = _img.shape[:2]
-
-            _str_list = [_file_name, f"{_shape[0]}, {_shape[1]}", "False"]
-
-            for _col_ct, _data in enumerate(_str_list):
-                _table.setItem(_ct, _col_ct, QTableWidgetItem(_data))
-
+            _names.append(_file_name)
+            _shapes.append(_shape)
             _read_data.append((
                 _file_name,
                 _img
             ))
 
-        if _new_files:
-            _table.setCurrentCell(0, 0)
-            self.img_widget.Set_img(_read_data[0][1])
-
+        self.file_model.Reset(_names, _shapes)
         self.is_refreshed.emit(_read_data)
 
-    def Remove(self, row_num_list: list[int]):
-        _table = self.file_table_widget
-        for _id in sorted(row_num_list, reverse=True):
-            for _col_ct in range(_table.columnCount()):
-                _table.takeItem(_id, _col_ct)
+        # the first row of the sorted and filtered view
+        _first = self.file_proxy.index(0, 0)
+        self.Select(self._Get_name_at(_first))
+        if not _new_files:
+            self.img_widget.clear()
 
-        _table.setRowCount(_table.rowCount() - len(row_num_list))
+    def Watch(self):
+        """
+        #### 디렉토리 확인을 작업자 스레드에서 시작 (이전 확인 중이면 건너뜀)
+        ----------------------------------------------------------------
+        """
+        if self._is_polling:
+            return
+        self._is_polling = True
+        QThreadPool.globalInstance().start(Watch_Worker(
+            self.watcher, self.watch_signal, self._watch_epoch))
+
+    def _Apply_changes(
+        self,
+        epoch: int,
+        added: list[str],
+        removed: list[str],
+        modified: list[str]
+    ):
+        """
+        #### 지난 확인 이후 바뀐 파일의 행만 갱신하고 변경 내용을 알림
+        ----------------------------------------------------------------
+        """
+        self._is_polling = False
+        if epoch != self._watch_epoch:  # refreshed while polling
+            return
+
+        if not (added or removed or modified):
+            return
+
+        _row_index = self.file_model.row_index
+        self.Remove([
+            _row_index[_file_name] for _file_name in removed
+            if _file_name in _row_index
+        ])
+
+        # only the new files are not applied yet, modified ones keep the flag
+        _changed: list[list[tuple[str, np.ndarray | str]]] = []
+        for _file_names, _is_applied in ((added, False), (modified, None)):
+            _data = []
+            for _file_name in _file_names:
+                _img, _shape = self._Read_row_data(
+                    Path.Join(_file_name, self.file_dir))
+                self.Update_row(_file_name, _shape, _is_applied)
+                _data.append((_file_name, _img))
+            _changed.append(_data)
+
+        self.is_changed.emit(_changed[0], removed, _changed[1])
+
+    def Show(self, img: np.ndarray | str) -> bool:
+        """
+        #### 이미지 표시. 파일 경로이면 축소 이미지 캐시를 먼저 사용
+        ----------------------------------------------------------------
+        """
+        with Tracer.Span("Show", "ui", img):
+            return self._Show(img)
+
+    def _Show(self, img: np.ndarray | str) -> bool:
+        _viewer = self.img_widget
+        _cache = self.thumbnail_cache
+
+        if isinstance(img, str) and _cache is not None:
+            _img = _cache.Get(img, _viewer.shape_limit)
+            if _img is None:
+                _viewer.clear()
+                return False
+            img = _img
+
+        if isinstance(img, str) or len(img.shape) >= 2:
+            return _viewer.Set_img(img)
+
+        _viewer.clear()
+        return False
+
+    def Find_row(self, file_name: str) -> int | None:
+        """ 파일 이름의 행 (정렬, 검색과 상관없는 모델의 행) """
+        return self.file_model.Find_row(file_name)
+
+    def Get_file_name(self, row: int) -> str | None:
+        return self.file_model.Get_file_name(row)
+
+    def Update_row(
+        self,
+        file_name: str,
+        shape: tuple[int, ...] | None = None,
+        is_applied: bool | None = True
+    ) -> int:
+        """
+        #### 파일 이름이 같은 행을 갱신하고, 없으면 마지막에 추가
+        ----------------------------------------------------------------
+        is_applied 가 None 이면 있던 행의 적용 여부는 그대로
+        """
+        return self.file_model.Update_row(file_name, shape, is_applied)
+
+    def Remove(self, row_num_list: list[int]):
+        """ 모델의 행 번호로 삭제 """
+        _model = self.file_model
+        _model.Remove(row_num_list)
 
-        if not _table.rowCount():
+        if not _model.rowCount():
             self.img_widget.clear()
 
 
@@ -0,0 +1,143 @@
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from threading import Event
+from typing import Any
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from utils.image_cache import Result_Cache
+from utils.image_process import Process, Apply_Block, Get_recipe
+from utils.dir_watcher import Directory_Watcher
+
+
+class Worker_Signal(QObject):
+    is_progressed: Signal = Signal(int, int, str)  # (index, total, file)
+    is_failed: Signal = Signal(int, str, str)  # (index, file, message)
+    is_finished: Signal = Signal(int, bool)  # (done count, is_cancelled)
+
+
+class Watch_Signal(QObject):
+    # (epoch, added, removed, modified file names)
+    is_polled: Signal = Signal(int, list, list, list)
+
+
+class Process_Worker(QRunnable):
+    """ ### 이미지 처리 과정을 GUI 스레드 밖에서 실행하는 작업자
+
+    이미지 한 장이 저장될 때마다 진행 신호를 보내고,
+    취소 요청은 다음 이미지를 시작하기 전에 확인한다.
+    저장 (인코딩) 은 다음 이미지를 처리하는 동안 백그라운드에서 실행한다.
+
+    ---------------------------------------------------------------------------
+    """
+    def __init__(
+        self,
+        apply_blocks: list[Apply_Block],
+        process_list: list[dict[str, Any]],
+        result_cache: Result_Cache | None = None
+    ) -> None:
+        super().__init__()
+        self.setAutoDelete(False)  # the owner keeps it until finished
+
+        self.signal = Worker_Signal()
+        self.apply_blocks = list(apply_blocks)
+        self.process_list = process_list
+        self.result_cache = result_cache
+
+        self._cancel_event = Event()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def Cancel(self):
+        self._cancel_event.set()
+
+    def _Report(
+        self, total: int, writing: dict[Future, tuple[int, str]], done: set
+    ) -> int:
+        _signal = self.signal
+        _done_ct = 0
+        for _future in done:
+            _ct, _file_name = writing.pop(_future)
+            _error = _future.exception()
+            if _error is None:
+                _done_ct += 1
+            else:
+                _message = f"{type(_error).__name__}: {_error}"
+                _signal.is_failed.emit(_ct, _file_name, _message)
+            _signal.is_progressed.emit(_ct, total, _file_name)
+        return _done_ct
+
+    def run(self):
+        _signal = self.signal
+        _blocks = self.apply_blocks
+        _process_list = self.process_list
+        _step_keys = Apply_Block.Get_step_keys(_process_list)
+        _total = len(_blocks)
+        _done = 0
+
+        # encode on the writer pool while the next image is processed,
+        # with a bounded number of results waiting to be written
+        _writing: dict[Future, tuple[int, str]] = {}
+        _max_writing = max(Process.writer.worker_num, 1) * 2
+
+        for _ct, _block in enumerate(_blocks):
+            if self.is_cancelled:
+                break
+
+            try:
+                _block.Set_process(_process_list, _step_keys)
+                _block(is_write=False)
+                _future = _block.Write(is_async=True)
+            except Exception as _error:  # keep the batch going
+                _message = f"{type(_error).__name__}: {_error}"
+                _signal.is_failed.emit(_ct, _block.file_name, _message)
+                _signal.is_progressed.emit(_ct, _total, _block.file_name)
+                continue
+
+            if _future is None:  # skipped, nothing to write
+                _done += 1
+                _signal.is_progressed.emit(_ct, _total, _block.file_name)
+                continue
+
+            _writing[_future] = (_ct, _block.file_name)
+            if len(_writing) >= _max_writing:
+                _finished, _ = wait(_writing, return_when=FIRST_COMPLETED)
+                _done += self._Report(_total, _writing, _finished)
+
+        _finished, _ = wait(_writing)
+        _done += self._Report(_total, _writing, _finished)
+
+        _result_cache = self.result_cache
+        if _result_cache is not None:
+            _result_cache.Add_recipe(
+                _step_keys[-1] if _step_keys else "",
+                Get_recipe(_process_list))
+            _result_cache.Save()
+
+        _signal.is_finished.emit(_done, self.is_cancelled)
+
+
+class Watch_Worker(QRunnable):
+    """ ### 디렉토리 확인 (scandir, stat) 을 GUI 스레드 밖에서 실행하는 작업자
+
+    파일이 많은 디렉토리는 한 번 확인하는 데 수 초가 걸린다.
+    결과는 실패해도 항상 보내서, 받는 쪽이 다음 확인을 시작할 수 있게 한다.
+
+    ---------------------------------------------------------------------------
+    """
+    def __init__(
+        self, watcher: Directory_Watcher, signal: Watch_Signal, epoch: int
+    ) -> None:
+        super().__init__()
+        self.watcher = watcher
+        self.signal = signal
+        # the directory version when started, stale results are dropped
+        self.epoch = epoch
+
+    def run(self):
+        try:
+            _added, _removed, _modified = self.watcher.Poll()
+        except OSError:  # the directory is gone or unreachable for now
+            _added, _removed, _modified = [], [], []
+        self.signal.is_polled.emit(self.epoch, _added, _removed, _modified)
@@ -0,0 +1,148 @@
+""" ### Batched background removal inference across threads
+
+------------------------------------------------------------------------
+### Requirement
+    numpy, rembg (onnxruntime, pillow)
+
+### Structure
+    Batch_Session: session-like wrapper of a rembg session. Images that
+        several threads pass to `predict` are preprocessed one by one,
+        run through the ONNX model together, and split back per image.
+
+    Used as the `session` of `rembg.remove`, so the cutout after the mask
+    is the same code as the single image path.
+
+"""
+from __future__ import annotations
+from threading import Condition
+from typing import Any
+
+import numpy as np
+
+
+_IMAGENET = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
+
+# model name -> (mean, std, input size, sigmoid on the output)
+# same values as the `predict` of each rembg session
+NORMALIZE_TABLE: dict[str, tuple[
+    tuple[float, float, float], tuple[float, float, float],
+    tuple[int, int], bool
+]] = {
+    "u2net": (*_IMAGENET, (320, 320), False),
+    "u2netp": (*_IMAGENET, (320, 320), False),
+    "u2net_human_seg": (*_IMAGENET, (320, 320), False),
+    "silueta": (*_IMAGENET, (320, 320), False),
+    "isnet-general-use": (
+        (0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024), False),
+    "bria-rmbg": (*_IMAGENET, (1024, 1024), False),
+    "birefnet-general": (*_IMAGENET, (1024, 1024), True),
+}
+
+
+class _Request():
+    def __init__(self, feed: dict[str, np.ndarray]) -> None:
+        self.feed = feed
+        self.pred: np.ndarray | None = None
+        self.error: Exception | None = None
+        self.is_done = False
+
+
+class Batch_Session():
+    """ ### 여러 스레드의 추론 요청을 모아 한 번에 실행하는 rembg 세션 래퍼
+
+    요청이 `batch_size` 만큼 모이거나 `wait_time` 이 지나면 모인 만큼 실행한다.
+    표에 없는 모델이나 배치 축이 고정된 모델은 원래 세션으로 한 장씩 추론한다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `session`: rembg 세션 (`new_session` 의 결과)
+    - `batch_size`: 한 번에 추론할 최대 이미지 수 (메모리에 맞게 조절)
+    - `wait_time`: 배치가 차기를 기다리는 최대 시간 (초)
+
+    """
+    def __init__(
+        self, session: Any, batch_size: int = 8, wait_time: float = 0.05
+    ) -> None:
+        self.session = session
+        self.batch_size = max(batch_size, 1)
+        self.wait_time = wait_time
+
+        self.model_name: str | None = getattr(session, "model_name", None)
+        self.is_batchable = self._Is_batchable()
+
+        self._pending: list[_Request] = []
+        self._condition = Condition()
+
+    def _Is_batchable(self) -> bool:
+        _inner = getattr(self.session, "inner_session", None)
+        if _inner is None or self.model_name not in NORMALIZE_TABLE:
+            return False
+        _batch_dim = _inner.get_inputs()[0].shape[0]
+        return not isinstance(_batch_dim, int) or _batch_dim != 1
+
+    def _Run(self, requests: list[_Request]):
+        try:
+            _feeds = [_request.feed for _request in requests]
+            _feed = {
+                _name: np.concatenate([_f[_name] for _f in _feeds])
+                for _name in _feeds[0]
+            }
+            _pred = self.session.inner_session.run(None, _feed)[0][:, 0]
+            for _ct, _request in enumerate(requests):
+                _request.pred = _pred[_ct]
+        except Exception as _error:  # every waiting image gets the error
+            for _request in requests:
+                _request.error = _error
+
+        with self._condition:
+            for _request in requests:
+                _request.is_done = True
+            self._condition.notify_all()
+
+    def _Submit(self, feed: dict[str, np.ndarray]) -> np.ndarray:
+        _request = _Request(feed)
+        _condition = self._condition
+
+        with _condition:
+            _pending = self._pending
+            _pending.append(_request)
+            _batch: list[_Request] = []
+
+            if len(_pending) >= self.batch_size:  # full, this thread runs it
+                _batch, self._pending = _pending, []
+            else:  # wait for the others, then run what is gathered
+                _condition.wait_for(
+                    lambda: _request not in self._pending, self.wait_time)
+                if _request in self._pending:
+                    _batch, self._pending = self._pending, []
+
+        if _batch:
+            self._Run(_batch)
+
+        with _condition:
+            _condition.wait_for(lambda: _request.is_done)
+
+        if _request.error is not None:
+            raise _request.error
+        assert _request.pred is not None
+        return _request.pred
+
+    def predict(self, img, *args, **kwargs):
+        if not self.is_batchable:
+            return self.session.predict(img, *args, **kwargs)
+
+        from PIL import Image
+
+        _mean, _std, _size, _is_sigmoid = NORMALIZE_TABLE[self.model_name]
+        _pred = self._Submit(self.session.normalize(img, _mean, _std, _size))
+
+        # the same post process as the predict of the session
+        if _is_sigmoid:
+            _pred = 1 / (1 + np.exp(-_pred))
+        _max = np.max(_pred)
+        _min = np.min(_pred)
+        _pred = (_pred - _min) / (_max - _min)
+
+        _mask = Image.fromarray(
+            (_pred.clip(0, 1) * 255).astype("uint8"), mode="L")
+        return [_mask.resize(img.size, Image.Resampling.LANCZOS)]
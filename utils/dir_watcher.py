@@ -0,0 +1,102 @@
+""" ### Polling watcher that turns directory changes into events
+
+------------------------------------------------------------------------
+### Requirement
+    None
+
+### Structure
+    Directory_Watcher: compare (mtime, size) snapshots of a directory and
+        report added / removed / modified files.
+
+    Polling works the same on local and network drives, where native
+    change notification is often missing.
+
+"""
+from __future__ import annotations
+from os import path
+
+from utils.system import Path
+
+
+class Directory_Watcher():
+    """ ### 디렉토리를 주기적으로 읽어 파일 변경을 알려주는 감시자
+
+    새 파일이나 바뀐 파일은 두 번 연속 같은 (수정 시각, 크기) 로
+    보일 때 알린다. 다른 프로그램이 아직 쓰고 있는 파일은 기다린다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `obj_dir`: 감시할 디렉토리
+    - `ext_filter`: 감시할 확장자 목록 (None 이면 모두)
+    - `is_recursive`: 하위 디렉토리까지 감시
+
+    """
+    def __init__(
+        self,
+        obj_dir: str,
+        ext_filter: str | list[str] | None = None,
+        is_recursive: bool = False
+    ) -> None:
+        self.obj_dir = obj_dir
+        self.ext_filter = ext_filter
+        self.is_recursive = is_recursive
+
+        # relative name -> (mtime_ns, size)
+        self.snapshot: dict[str, tuple[int, int]] = {}
+        self._pending: dict[str, tuple[int, int]] = {}
+
+    def Scan(self) -> dict[str, tuple[int, int]]:
+        _obj_dir = self.obj_dir
+        _snapshot: dict[str, tuple[int, int]] = {}
+        if not Path.Exist_check(_obj_dir, Path.Type.DIR):
+            return _snapshot
+
+        for _entry in Path.Scan(
+            _obj_dir, Path.Type.FILE,
+            ext_filter=self.ext_filter, is_recursive=self.is_recursive
+        ):
+            try:
+                _stat = _entry.stat()
+            except OSError:  # removed while scanning
+                continue
+            _name = path.relpath(_entry.path, _obj_dir) if (
+                self.is_recursive) else _entry.name
+            _snapshot[_name] = (_stat.st_mtime_ns, _stat.st_size)
+        return _snapshot
+
+    def Reset(self, snapshot: dict[str, tuple[int, int]] | None = None):
+        """
+        #### 현재 상태를 기준으로 다시 시작 (전체 새로고침 뒤에 호출)
+        ----------------------------------------------------------------
+        """
+        self.snapshot = self.Scan() if snapshot is None else snapshot
+        self._pending = {}
+
+    def Poll(self) -> tuple[list[str], list[str], list[str]]:
+        """
+        #### 지난 확인 이후 바뀐 파일 -> (추가, 삭제, 수정) 이름 목록
+        ----------------------------------------------------------------
+        """
+        _new = self.Scan()
+        _old = self.snapshot
+        _old_pending = self._pending
+
+        _added: list[str] = []
+        _modified: list[str] = []
+        _pending: dict[str, tuple[int, int]] = {}
+
+        for _name, _stat in _new.items():
+            if _old.get(_name) == _stat:
+                continue
+            if _old_pending.get(_name) != _stat:  # still being written
+                _pending[_name] = _stat
+                continue
+            (_modified if _name in _old else _added).append(_name)
+            _old[_name] = _stat
+
+        _removed = [_name for _name in _old if _name not in _new]
+        for _name in _removed:
+            del _old[_name]
+
+        self._pending = _pending
+        return sorted(_added), sorted(_removed), sorted(_modified)
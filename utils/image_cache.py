@@ -0,0 +1,491 @@
+""" ### Caches that keep decoded image data within a memory budget
+
+------------------------------------------------------------------------
+### Requirement
+    numpy, opencv
+
+### Structure
+    Image_Cache: least recently used cache bounded by bytes and count
+    Image_Store: memory bounded store of arrays without a source file,
+        that spills cold ones to disk and hands out `Image_Handle`
+    Thumbnail_Cache: on-disk pyramid of downscaled previews
+    Result_Cache: manifest of (input, recipe) hashes of written results
+
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from hashlib import sha1
+from itertools import count
+from os import stat, path, replace, listdir, remove, utime
+from tempfile import TemporaryDirectory
+from threading import RLock
+from typing import Any, Callable, Hashable
+from weakref import finalize
+
+import numpy as np
+import cv2
+
+from utils.system import Path, File
+
+
+class Image_Cache():
+    """ ### 메모리 한도 내에서 디코딩된 이미지를 보관하는 LRU 캐시
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `max_bytes`: 보관할 배열 크기의 합 상한 (0 이하면 제한 없음)
+    - `max_count`: 보관할 배열 개수 상한 (0 이하면 제한 없음)
+
+    """
+    def __init__(self, max_bytes: int = 1 << 30, max_count: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+
+        self.holder: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self.size: int = 0
+
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self.holder)
+
+    def __contains__(self, key: Hashable):
+        return key in self.holder
+
+    def _Is_over(self):
+        _max_bytes, _max_count = self.max_bytes, self.max_count
+        return (_max_bytes > 0 and self.size > _max_bytes) or (
+            _max_count > 0 and len(self.holder) > _max_count)
+
+    def Put(self, key: Hashable, img: np.ndarray):
+        with self._lock:
+            self.Pop(key)
+            self.holder[key] = img
+            self.size += img.nbytes
+            _evicted = self._Pop_over()
+
+        for _old_key, _old in _evicted:  # slow work outside of the lock
+            self._Evict(_old_key, _old)
+
+    def _Pop_over(self) -> list[tuple[Hashable, np.ndarray]]:
+        _evicted: list[tuple[Hashable, np.ndarray]] = []
+        # keep the newest one even if it is bigger than the budget
+        while len(self.holder) > 1 and self._Is_over():
+            _key, _img = self.holder.popitem(last=False)
+            self.size -= _img.nbytes
+            _evicted.append((_key, _img))
+        return _evicted
+
+    def _Evict(self, key: Hashable, img: np.ndarray):
+        """ 한도를 넘어 밀려난 배열 처리 (기본: 버림) """
+
+    def Get(
+        self,
+        key: Hashable,
+        loader: Callable[[], np.ndarray | None] | None = None
+    ) -> np.ndarray | None:
+        with self._lock:
+            _holder = self.holder
+            if key in _holder:
+                _holder.move_to_end(key)
+                return _holder[key]
+
+        if loader is None:
+            return None
+
+        _img = loader()  # decode outside of the lock
+        if _img is not None:
+            self.Put(key, _img)
+        return _img
+
+    def Pop(self, key: Hashable, default: Any = None):
+        with self._lock:
+            if key in self.holder:
+                _img = self.holder.pop(key)
+                self.size -= _img.nbytes
+                return _img
+        return default
+
+    def Clear(self):
+        with self._lock:
+            self.holder.clear()
+            self.size = 0
+
+
+class Image_Handle():
+    """ ### `Image_Store` 에 보관된 배열을 가리키는 가벼운 참조
+
+    핸들이 사라지면 저장소의 배열과 디스크에 내보낸 파일도 지운다.
+
+    ---------------------------------------------------------------------------
+    """
+    def __init__(
+        self, store: Image_Store, key: int, img: np.ndarray
+    ) -> None:
+        self.store = store
+        self.key = key
+        self.shape: tuple[int, ...] = img.shape
+        self.dtype = img.dtype
+        self.nbytes: int = img.nbytes
+
+        self._finalizer = finalize(self, store.Release, key)
+
+    def Get(self) -> np.ndarray:
+        _img = self.store.Get(self.key)
+        if _img is None:
+            raise KeyError(f"image {self.key} is already released")
+        return _img
+
+    def Release(self):
+        self._finalizer()
+
+
+class Image_Store(Image_Cache):
+    """ ### 원본 파일이 없는 배열 (처리 결과 등) 을 메모리 한도 내에서 보관
+
+    한도를 넘으면 오래 쓰지 않은 배열을 디스크 (npy) 로 내보내고,
+    다시 필요할 때 읽어 온다. 원본 파일이 있는 이미지는 경로를 들고
+    `Image_Cache` 에서 다시 디코딩하는 쪽이 싸므로 여기에 두지 않는다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `max_bytes`: 메모리에 둘 배열 크기의 합 상한 (0 이하면 제한 없음)
+    - `spill_dir`: 내보낸 배열을 둘 경로 (None 이면 처음 내보낼 때 임시 경로)
+
+    """
+    def __init__(
+        self, max_bytes: int = 1 << 30, spill_dir: str | None = None
+    ) -> None:
+        super().__init__(max_bytes)
+        self.spill_dir = spill_dir
+        self._temp_dir: TemporaryDirectory | None = None
+
+        # key -> npy file, and arrays being written to it
+        self.spilled: dict[Hashable, str] = {}
+        self._spilling: dict[Hashable, np.ndarray] = {}
+        self._serial = count()
+
+    def _Get_spill_dir(self) -> str:
+        if self.spill_dir is None:
+            self._temp_dir = TemporaryDirectory(prefix="image_store_")
+            self.spill_dir = self._temp_dir.name
+        return self.spill_dir
+
+    def _Pop_over(self) -> list[tuple[Hashable, np.ndarray]]:
+        _evicted = super()._Pop_over()
+        for _key, _img in _evicted:  # readable until the file is written
+            if _key not in self.spilled:
+                self._spilling[_key] = _img
+        return _evicted
+
+    def _Evict(self, key: Hashable, img: np.ndarray):
+        with self._lock:
+            if key not in self._spilling:  # read back before, file is kept
+                return
+            _file = path.join(self._Get_spill_dir(), f"{key}.npy")
+
+        np.save(_file, img, allow_pickle=False)
+
+        with self._lock:
+            if self._spilling.pop(key, None) is None:  # released meanwhile
+                remove(_file)
+            else:
+                self.spilled[key] = _file
+
+    def Hold(self, img: np.ndarray) -> Image_Handle:
+        """
+        #### 배열을 보관하고 핸들 반환 (배열은 이후 수정 금지)
+        ----------------------------------------------------------------
+        """
+        _key = next(self._serial)
+        self.Put(_key, img)
+        return Image_Handle(self, _key, img)
+
+    def Get(
+        self,
+        key: Hashable,
+        loader: Callable[[], np.ndarray | None] | None = None
+    ) -> np.ndarray | None:
+        with self._lock:
+            _img = self._spilling.get(key)
+            _file = self.spilled.get(key)
+        if _img is not None:
+            return _img
+        if _file is None:
+            return super().Get(key, loader)
+
+        return super().Get(key, lambda: np.load(_file))
+
+    def Release(self, key: Hashable):
+        with self._lock:
+            self.Pop(key)
+            self._spilling.pop(key, None)
+            _file = self.spilled.pop(key, None)
+        if _file is not None and path.exists(_file):
+            remove(_file)
+
+    def Clear(self):
+        with self._lock:
+            super().Clear()
+            _files = list(self.spilled.values())
+            self.spilled.clear()
+            self._spilling.clear()
+        for _file in _files:
+            if path.exists(_file):
+                remove(_file)
+
+
+class Thumbnail_Cache():
+    """ ### 미리보기용 축소 이미지를 여러 크기로 디스크에 저장하는 캐시
+
+    원본 경로, 수정 시각, 파일 크기로 키를 만들기 때문에
+    원본이 바뀌면 자동으로 새로 만들고, 프로그램을 다시 켜도 유지된다.
+    바뀐 원본의 예전 축소 이미지는 용량 한도를 넘으면
+    오래 쓰지 않은 것부터 지운다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `cache_dir`: 축소 이미지 저장 경로 (기본: 작업 경로의 .cache/thumbnail)
+    - `sizes`: 저장할 긴 변 길이 목록
+    - `max_bytes`: 저장 파일 크기의 합 상한 (0 이하면 제한 없음)
+
+    """
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        sizes: tuple[int, ...] = (128, 256, 512, 1024),
+        max_bytes: int = 1 << 30
+    ) -> None:
+        self.cache_dir = Path.Make_directory(
+            [".cache", "thumbnail"] if cache_dir is None else cache_dir)
+        self.sizes = tuple(sorted(sizes))
+
+        # files over the budget are removed, least recently used first
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.Prune()
+
+    @staticmethod
+    def Get_key(file_path: str) -> str | None:
+        try:
+            _stat = stat(file_path)
+        except OSError:
+            return None
+        _source = "|".join((
+            path.abspath(file_path), str(_stat.st_mtime_ns), str(_stat.st_size)
+        ))
+        return sha1(_source.encode("UTF-8")).hexdigest()
+
+    def _Get_file(self, key: str, size: int):
+        return Path.Join(f"{key}_{size}.png", self.cache_dir)
+
+    def _Pick_size(self, shape_limit: int):
+        for _size in self.sizes:
+            if _size >= shape_limit > 0:
+                return _size
+        return self.sizes[-1]
+
+    def Build(
+        self, file_path: str, img: np.ndarray | None = None
+    ) -> dict[int, np.ndarray]:
+        """
+        #### 원본 (또는 이미 디코딩된 배열) 에서 모든 크기의 축소 이미지 생성
+        ----------------------------------------------------------------
+        """
+        _key = self.Get_key(file_path)
+        if _key is None:
+            return {}
+
+        _img = cv2.imread(file_path, cv2.IMREAD_UNCHANGED) if (
+            img is None) else img
+        if _img is None or _img.ndim < 2:
+            return {}
+
+        _pyramid: dict[int, np.ndarray] = {}
+        for _size in reversed(self.sizes):  # big to small, reuse the last
+            _h, _w = _img.shape[:2]
+            if max(_h, _w) > _size:
+                _rate = _size / max(_h, _w)
+                _img = cv2.resize(
+                    _img,
+                    (max(round(_w * _rate), 1), max(round(_h * _rate), 1)),
+                    interpolation=cv2.INTER_AREA)
+            _pyramid[_size] = _img
+
+            # write to temp file then rename, so readers never see half
+            _file = self._Get_file(_key, _size)
+            _temp = f"{_file}.tmp.png"
+            if cv2.imwrite(_temp, _img):
+                replace(_temp, _file)
+                self.size += path.getsize(_file)
+
+        if 0 < self.max_bytes < self.size:
+            self.Prune()
+        return _pyramid
+
+    def Prune(self, rate: float = 0.8):
+        """
+        #### 전체 크기가 한도를 넘으면 오래 쓰지 않은 파일부터 삭제
+        ----------------------------------------------------------------
+        한도의 rate 비율까지 줄인다. 사용 시각은 파일 수정 시각
+        (`Get` 에서 읽을 때 갱신)
+        """
+        _files: list[tuple[int, int, str]] = []
+        for _entry in Path.Scan(
+            self.cache_dir, Path.Type.FILE, ext_filter="png"
+        ):
+            try:
+                _stat = _entry.stat()
+            except OSError:  # removed by another instance
+                continue
+            _files.append((_stat.st_mtime_ns, _stat.st_size, _entry.path))
+
+        _size = sum(_bytes for _, _bytes, _ in _files)
+        if 0 < self.max_bytes < _size:
+            _target = self.max_bytes * rate
+            for _, _bytes, _file in sorted(_files):  # oldest first
+                if _size <= _target:
+                    break
+                try:
+                    remove(_file)
+                except OSError:
+                    continue
+                _size -= _bytes
+        self.size = _size
+
+    def Get(self, file_path: str, shape_limit: int = -1) -> np.ndarray | None:
+        _key = self.Get_key(file_path)
+        if _key is None:
+            return None
+
+        _size = self._Pick_size(shape_limit)
+        _file = self._Get_file(_key, _size)
+
+        if Path.Exist_check(_file, Path.Type.FILE):
+            _img = cv2.imread(_file, cv2.IMREAD_UNCHANGED)
+            if _img is not None:
+                try:
+                    utime(_file)  # recently used, pruned last
+                except OSError:
+                    pass
+                return _img
+
+        return self.Build(file_path).get(_size)
+
+    def Clear(self):
+        _dir = self.cache_dir
+        for _file in listdir(_dir):
+            if _file.endswith(".png"):
+                remove(Path.Join(_file, _dir))
+        self.size = 0
+
+
+class Result_Cache():
+    """ ### 저장 경로에 기록된 결과의 (입력, 처리 과정) 해시 목록
+
+    입력 파일 내용과 처리 과정이 같고 결과 파일이 남아 있으면
+    디코딩, 처리, 저장을 모두 건너뛸 수 있다.
+    입력 파일의 수정 시각과 크기가 그대로면 내용을 다시 해시하지 않는다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `save_dir`: 결과 이미지와 목록 파일을 저장하는 경로
+    - `file_name`: 목록 파일 이름
+
+    """
+    def __init__(
+        self, save_dir: str, file_name: str = ".manifest.yaml"
+    ) -> None:
+        self.save_dir = save_dir
+        self.file_name = file_name
+
+        # recipe key -> process list, output file name -> entry
+        self.recipes: dict[str, Any] = {}
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.is_changed = False
+
+        self._lock = RLock()
+        self.Load()
+
+    def Load(self):
+        _file = Path.Join(self.file_name, self.save_dir)
+        _manifest = File.YAML.Read(self.file_name, self.save_dir) if (
+            Path.Exist_check(_file, Path.Type.FILE)) else None
+
+        if not isinstance(_manifest, dict):
+            _manifest = {}
+        with self._lock:
+            self.recipes = _manifest.get("recipe") or {}
+            self.entries = _manifest.get("file") or {}
+            self.is_changed = False
+
+    def Save(self):
+        with self._lock:
+            if not self.is_changed:
+                return
+            _manifest = {"recipe": self.recipes, "file": self.entries}
+            File.YAML.Write(self.file_name, self.save_dir, _manifest)
+            self.is_changed = False
+
+    @staticmethod
+    def Hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+        _hash = sha1()
+        with open(file_path, "rb") as _file:
+            while _chunk := _file.read(chunk_size):
+                _hash.update(_chunk)
+        return _hash.hexdigest()
+
+    @staticmethod
+    def Hash_array(img: np.ndarray) -> str:
+        _hash = sha1(f"{img.shape}|{img.dtype}|".encode("UTF-8"))
+        _hash.update(np.ascontiguousarray(img).data)
+        return _hash.hexdigest()
+
+    def Make_entry(
+        self, file_name: str, img: np.ndarray | str, recipe_key: str
+    ) -> dict[str, Any]:
+        """
+        #### 입력 (파일 경로 또는 배열) 과 처리 과정 키로 목록 항목 생성
+        ----------------------------------------------------------------
+        """
+        if not isinstance(img, str):
+            return {"input": self.Hash_array(img), "recipe": recipe_key}
+
+        _stat = stat(img)
+        _entry = {
+            "input": "",
+            "recipe": recipe_key,
+            "mtime_ns": _stat.st_mtime_ns,
+            "size": _stat.st_size
+        }
+
+        # same stat as the last run -> reuse the hash of the content
+        _old = self.entries.get(file_name, {})
+        if _old.get("mtime_ns") == _stat.st_mtime_ns and (
+            _old.get("size") == _stat.st_size
+        ) and _old.get("input"):
+            _entry["input"] = _old["input"]
+        else:
+            _entry["input"] = self.Hash_file(img)
+        return _entry
+
+    def Is_hit(self, file_name: str, entry: dict[str, Any]) -> bool:
+        _old = self.entries.get(file_name)
+        if _old is None or _old.get("input") != entry["input"] or (
+            _old.get("recipe") != entry["recipe"]
+        ):
+            return False
+        return Path.Exist_check(
+            Path.Join(file_name, self.save_dir), Path.Type.FILE)
+
+    def Update(self, file_name: str, entry: dict[str, Any]):
+        with self._lock:
+            if self.entries.get(file_name) != entry:
+                self.entries[file_name] = entry
+                self.is_changed = True
+
+    def Add_recipe(self, recipe_key: str, recipe: Any):
+        with self._lock:
+            if recipe_key not in self.recipes:
+                self.recipes[recipe_key] = recipe
+                self.is_changed = True
@@ -1,50 +1,300 @@
+from __future__ import annotations
+from concurrent.futures import Future
 from typing import Any
+from threading import Lock
+from itertools import count
+from hashlib import sha1
+import json
 import numpy as np
 
 import cv2
-from rembg import remove
 
 from utils.system import Path
+from utils.image_cache import (
+    Image_Cache, Image_Store, Image_Handle, Result_Cache)
+from utils.image_writer import Image_Writer
+from utils.trace import Tracer
+
+
+# JPEG start of frame markers (without DHT, JPG and DAC)
+_JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _Canonical(value: Any):
+    if isinstance(value, np.ndarray):
+        return {
+            "ndarray": sha1(np.ascontiguousarray(value).data).hexdigest(),
+            "shape": list(value.shape),
+            "dtype": str(value.dtype)
+        }
+    if isinstance(value, dict):
+        return {str(_k): _Canonical(_v) for _k, _v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_Canonical(_v) for _v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def Get_process_key(process: dict[str, Any] | list[dict[str, Any]]) -> str:
+    """
+    #### 과정 정보 ({"process": ..., "arg": ...}) 의 고정된 해시 값
+    ----------------------------------------------------------------
+    tuple 과 list 는 같은 값으로 보고, 배열은 내용으로 해시
+    """
+    _text = json.dumps(_Canonical(process), sort_keys=True, default=str)
+    return sha1(_text.encode("UTF-8")).hexdigest()
+
+
+def Get_recipe(process_list: list[dict[str, Any]]) -> list[Any]:
+    """
+    #### yaml 로 저장할 수 있는 과정 정보 목록 (배열은 해시로 대체)
+    ----------------------------------------------------------------
+    """
+    return _Canonical(process_list)
+
+
+class Session_Manager():
+    """ ### 배경 제거 모델 추론 세션 관리
+
+    프로세스 당 (모델, 스레드 설정) 조합 별로 한 번만 세션을 만들고,
+    이후 모든 이미지에서 재사용한다.
+    rembg 와 onnxruntime 은 처음 세션을 만들 때 불러온다.
+    `Set_batch` 로 배치 크기를 정하면 여러 스레드의 추론을 모아서 실행한다.
+
+    ---------------------------------------------------------------------------
+    """
+    sessions: dict[tuple[str | None, int, int], Any] = {}
+    _lock = Lock()
+
+    # batched inference over threads (1: one image per run)
+    batch_size: int = 1
+    batch_wait: float = 0.05
+    batch_sessions: dict[tuple[str | None, int, int], Any] = {}
+
+    @staticmethod
+    def _New_session(
+        model_name: str | None, intra_op_threads: int, inter_op_threads: int
+    ):
+        from onnxruntime import SessionOptions
+        from rembg import new_session
+
+        _opts = SessionOptions()
+        _opts.intra_op_num_threads = intra_op_threads  # 0: runtime default
+        _opts.inter_op_num_threads = inter_op_threads
+
+        if model_name is None:  # default model of the installed rembg
+            return new_session(sess_opts=_opts)
+        return new_session(model_name, sess_opts=_opts)
+
+    @classmethod
+    def Get(
+        cls,
+        model_name: str | None = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0
+    ):
+        _key = (model_name, intra_op_threads, inter_op_threads)
+
+        with cls._lock:
+            if _key not in cls.sessions:
+                cls.sessions[_key] = cls._New_session(*_key)
+            if cls.batch_size <= 1:
+                return cls.sessions[_key]
+
+            if _key not in cls.batch_sessions:
+                from utils.batch_inference import Batch_Session
+
+                cls.batch_sessions[_key] = Batch_Session(
+                    cls.sessions[_key], cls.batch_size, cls.batch_wait)
+            return cls.batch_sessions[_key]
+
+    @classmethod
+    def Set_batch(cls, batch_size: int, wait_time: float = 0.05):
+        """ 추론 배치 크기 설정 (결과는 배치 크기와 상관없이 같음) """
+        with cls._lock:
+            cls.batch_size = batch_size
+            cls.batch_wait = wait_time
+            cls.batch_sessions.clear()
+
+    @classmethod
+    def Register(
+        cls,
+        session: Any,
+        model_name: str | None = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0
+    ):
+        """ 미리 만든 세션 (또는 같은 predict 를 가진 객체) 등록 """
+        _key = (model_name, intra_op_threads, inter_op_threads)
+        with cls._lock:
+            cls.sessions[_key] = session
+            cls.batch_sessions.pop(_key, None)
+
+    @classmethod
+    def Clear(cls):
+        with cls._lock:
+            cls.sessions.clear()
+            cls.batch_sessions.clear()
 
 
 class Process():
     @staticmethod
     def Read(img_file: str):
-        return cv2.imread(img_file, cv2.IMREAD_UNCHANGED)
+        with Tracer.Span("Read", "io", img_file) as _span:
+            _img = cv2.imread(img_file, cv2.IMREAD_UNCHANGED)
+            _span.Set_output(_img)
+        return _img
 
     @staticmethod
-    def Write(img: np.ndarray, file_path: str, file_name: str):
-        cv2.imwrite(Path.Join(file_name, file_path), img)
+    def Read_shape(img_file: str) -> tuple[int, int] | None:
+        """
+        #### 픽셀 디코딩 없이 파일 헤더에서 이미지 크기 (h, w) 확인
+        ----------------------------------------------------------------
+        png, jpg 이외의 형식은 디코딩하여 확인하고,
+        읽을 수 없는 파일이면 None 반환
+        """
+        try:
+            with open(img_file, "rb") as _file:
+                _head = _file.read(24)
 
-    class Basement():
-        def __init__(self) -> None:
-            self.input: np.ndarray = np.empty(0)
+                if _head[:8] == b"\x89PNG\r\n\x1a\n" and (
+                    _head[12:16] == b"IHDR"
+                ):
+                    _w = int.from_bytes(_head[16:20], "big")
+                    _h = int.from_bytes(_head[20:24], "big")
+                    return _h, _w
+
+                if _head[:2] == b"\xff\xd8":
+                    _file.seek(2)
+                    while True:
+                        _byte = _file.read(1)
+                        while _byte == b"\xff":  # skip fill bytes
+                            _byte = _file.read(1)
+                        if not _byte:
+                            break
+                        _marker = _byte[0]
+
+                        if _marker == 0x01 or 0xD0 <= _marker <= 0xD8:
+                            continue  # marker without length
+                        _len = int.from_bytes(_file.read(2), "big")
+                        if _marker in _JPEG_SOF:
+                            _frame = _file.read(5)
+                            _h = int.from_bytes(_frame[1:3], "big")
+                            _w = int.from_bytes(_frame[3:5], "big")
+                            return _h, _w
+                        if _marker == 0xD9 or _len < 2:
+                            break
+                        _file.seek(_len - 2, 1)
+        except OSError:
+            return None
+
+        _img = Process.Read(img_file)
+        return None if _img is None else _img.shape[:2]
+
+    # encode options of each format and the background write pool
+    writer = Image_Writer()
 
+    @staticmethod
+    def Write(img: np.ndarray, file_path: str, file_name: str) -> str:
+        return Process.writer.Write(img, Path.Join(file_name, file_path))
+
+    class Basement():
+        # keep no reference to the image, every block has its own steps
         def __call__(self, img: np.ndarray) -> np.ndarray:
-            self.input = img
+            return img
+
+        # border used when the step is run as a warp
+        border: int = cv2.BORDER_REPLICATE
+
+        @property
+        def warp_interpolation(self) -> int | None:
+            """
+            #### warpAffine 으로 실행할 때의 보간 방법
+            ----------------------------------------------------------------
+            None: 픽셀을 정수 칸만 옮겨서 (Flip, Crop) 어느 방법이든 같음.
+            INTER_AREA: 2 배 넘게 줄이면 area 로 미리 줄인 뒤 linear
+            """
+            return None
+
+        @property
+        def is_affine(self) -> bool:
+            return False
+
+        @property
+        def is_tile_local(self) -> bool:
+            """ 출력의 각 픽셀이 같은 위치의 입력 픽셀로만 결정되는지 여부 """
+            return False
+
+        def Get_affine(
+            self, shape: tuple[int, ...]
+        ) -> tuple[np.ndarray, tuple[int, int]]:
+            """
+            #### 입력 크기에 대한 3x3 변환 행렬 (입력 -> 출력 좌표) 과
+            #### 출력 크기 (h, w) 반환. `is_affine` 인 과정만 지원
+            ----------------------------------------------------------------
+            """
+            raise NotImplementedError
 
     # @staticmethod
     # def Remove_background(img: np.ndarray):
     #     return remove(img)
 
     class Resize(Basement):
+        """
+        #### 크기 변경
+        ----------------------------------------------------------------
+        - `interpolation`: 보간 방법 (`INTERPOLATION` 의 이름 또는 cv2 값)
+          None 이나 "auto" 이면 확대는 linear, 축소는 area.
+          4 배 이상 축소하면 pyrDown 을 반복해 2 배 안쪽으로 줄인 뒤 area
+          (area 보다 2 배 정도 빠르고, 출력 픽셀의 1/4 이내로 치우칠 수 있음)
+        """
+        INTERPOLATION: dict[str, int] = {
+            "nearest": cv2.INTER_NEAREST,
+            "linear": cv2.INTER_LINEAR,
+            "cubic": cv2.INTER_CUBIC,
+            "area": cv2.INTER_AREA,
+            "lanczos4": cv2.INTER_LANCZOS4
+        }
+        # dtypes of cv2.pyrDown
+        PYRAMID_DTYPES = (
+            np.uint8, np.uint16, np.int16, np.float32, np.float64)
+
         def __init__(
             self,
             height: int | float = 0,
             width: int | float = 0,
-            interpolation: int | None = None
+            interpolation: int | str | None = None
         ) -> None:
             super().__init__()
             self.height = height
             self.width = width
-            self.interpolation = interpolation
+            self.interpolation = self.Get_interpolation(interpolation)
 
-        def __call__(self, img: np.ndarray) -> np.ndarray:
-            super().__call__(img)
+        @classmethod
+        def Get_interpolation(
+            cls, interpolation: int | str | None
+        ) -> int | None:
+            """ 보간 방법 이름 또는 값 -> cv2 값 (None: 자동) """
+            if interpolation is None or interpolation == "auto":
+                return None
+            if isinstance(interpolation, str):
+                _name = interpolation.lower()
+                if _name not in cls.INTERPOLATION:
+                    raise ValueError(
+                        f"interpolation '{interpolation}' is not supported")
+                return cls.INTERPOLATION[_name]
+            if interpolation < 0:  # what the disabled combo box gave
+                return None
+            if interpolation not in cls.INTERPOLATION.values():
+                raise ValueError(
+                    f"interpolation {interpolation} is not supported")
+            return int(interpolation)
 
+        def _Get_size(self, shape: tuple[int, ...]) -> tuple[int, int]:
             _h, _w = self.height, self.width
 
-            _img_h, _img_w = img.shape[:2]
+            _img_h, _img_w = shape[:2]
             if _h > 0 or _w > 0:
                 if _h <= 0:
                     _to_w = _w if isinstance(_w, int) else round(_w * _img_w)
@@ -54,8 +304,68 @@ class Process():
                     _to_h = _h if isinstance(_h, int) else round(_h * _img_h)
                     _to_w = round(_to_h / _img_h * _img_w)
 
-                return cv2.resize(img, (_to_w, _to_h))
-            return img
+                return _to_h, _to_w
+            return _img_h, _img_w
+
+        @classmethod
+        def Shrink(cls, img: np.ndarray, to_h: int, to_w: int) -> np.ndarray:
+            """
+            #### pyrDown 으로 2 배 안쪽까지 줄인 뒤 area 로 맞춤
+            ----------------------------------------------------------------
+            """
+            if img.dtype in cls.PYRAMID_DTYPES:
+                while (img.shape[0] + 1) // 2 >= to_h * 2 and (
+                    img.shape[1] + 1
+                ) // 2 >= to_w * 2:
+                    img = cv2.pyrDown(img)
+            if img.shape[:2] == (to_h, to_w):
+                return img
+            return cv2.resize(
+                img, (to_w, to_h), interpolation=cv2.INTER_AREA)
+
+        def __call__(self, img: np.ndarray) -> np.ndarray:
+            super().__call__(img)
+
+            _to_h, _to_w = self._Get_size(img.shape)
+            if (_to_h, _to_w) == img.shape[:2]:
+                return img
+
+            _flag = self.interpolation
+            if _flag == cv2.INTER_NEAREST:
+                # resize rounds the ties of the pixel centers differently,
+                # pick the same pixels as a fused warp
+                _m, _ = self.Get_affine(img.shape)
+                return Process.Warp.Apply(
+                    img, _m, (_to_h, _to_w), _flag, cv2.BORDER_REPLICATE)
+            if _flag is not None:
+                return cv2.resize(img, (_to_w, _to_h), interpolation=_flag)
+            if _to_h < img.shape[0] and _to_w < img.shape[1]:
+                return self.Shrink(img, _to_h, _to_w)
+            return cv2.resize(
+                img, (_to_w, _to_h), interpolation=cv2.INTER_LINEAR)
+
+        @property
+        def warp_interpolation(self) -> int | None:
+            # auto shrinks with area and enlarges with linear, as the warp
+            _flag = self.interpolation
+            return cv2.INTER_AREA if _flag is None else _flag
+
+        @property
+        def is_affine(self) -> bool:
+            return True
+
+        def Get_affine(self, shape: tuple[int, ...]):
+            _img_h, _img_w = shape[:2]
+            _to_h, _to_w = self._Get_size(shape)
+            _sx, _sy = _to_w / _img_w, _to_h / _img_h
+
+            # same pixel center alignment as cv2.resize
+            _m = np.array([
+                [_sx, 0, 0.5 * _sx - 0.5],
+                [0, _sy, 0.5 * _sy - 0.5],
+                [0, 0, 1]
+            ])
+            return _m, (_to_h, _to_w)
 
     class Flip(Basement):
         def __init__(
@@ -67,10 +377,31 @@ class Process():
 
         def __call__(self, img: np.ndarray) -> np.ndarray:
             super().__call__(img)
-            _img = cv2.flip(img, 1) if self.vertical else img
-            return cv2.flip(img, 0) if self.horizontal else _img
+            _vertical, _horizontal = self.vertical, self.horizontal
+
+            if _vertical and _horizontal:
+                return cv2.flip(img, -1)
+            if _vertical:
+                return cv2.flip(img, 1)
+            return cv2.flip(img, 0) if _horizontal else img
+
+        @property
+        def is_affine(self) -> bool:
+            return True
+
+        def Get_affine(self, shape: tuple[int, ...]):
+            _h, _w = shape[:2]
+            _m = np.eye(3)
+
+            if self.vertical:  # same as cv2.flip(img, 1)
+                _m[0] = [-1, 0, _w - 1]
+            if self.horizontal:  # same as cv2.flip(img, 0)
+                _m[1] = [0, -1, _h - 1]
+            return _m, (_h, _w)
 
     class Rotate(Basement):
+        border: int = cv2.BORDER_CONSTANT
+
         def __init__(
             self, rotate: float, center_rate: tuple[float, float]
         ) -> None:
@@ -78,64 +409,174 @@ class Process():
             self.rotate = rotate
             self.center_rate = center_rate
 
-        def __call__(self, img: np.ndarray) -> np.ndarray:
-            super().__call__(img)
-            _h, _w = img.shape[:2]
+        def _Get_matrix(self, shape: tuple[int, ...]) -> np.ndarray:
+            _h, _w = shape[:2]
 
             _center_rate = self.center_rate
             _center = round(_w * _center_rate[0]), round(_h * _center_rate[1])
 
-            _m = cv2.getRotationMatrix2D(_center, self.rotate, 1)
+            return cv2.getRotationMatrix2D(_center, self.rotate, 1)
+
+        def __call__(self, img: np.ndarray) -> np.ndarray:
+            super().__call__(img)
+            _h, _w = img.shape[:2]
+
+            _m = self._Get_matrix(img.shape)
 
             return cv2.warpAffine(img, _m, (_w, _h))
 
+        @property
+        def is_affine(self) -> bool:
+            return True
+
+        @property
+        def warp_interpolation(self) -> int | None:
+            return cv2.INTER_LINEAR
+
+        def Get_affine(self, shape: tuple[int, ...]):
+            _m = np.vstack([self._Get_matrix(shape), [0, 0, 1]])
+            return _m, (shape[0], shape[1])
+
     class Masking(Basement):
+        """
+        #### 마스크 영역만 남기고, 알파 채널이 없으면 마스크를 알파로 추가
+        ----------------------------------------------------------------
+        - `is_positive`: True 이면 마스크 영역을 지우고 나머지를 남김
+        - `is_inplace`: True 이면 4 채널 / 흑백 입력을 그 자리에서 수정
+        """
         def __init__(
-            self, mask: np.ndarray, is_positive: bool = False
+            self,
+            mask: np.ndarray,
+            is_positive: bool = False,
+            is_inplace: bool = False
         ) -> None:
             super().__init__()
-            self.mask = mask.astype(np.bool)
             self.is_positive = is_positive
+            self.is_inplace = is_inplace
+
+            self.mask: np.ndarray = np.empty(0, dtype=bool)
+            self.keep: np.ndarray = self.mask
+            self.Set_mask(mask)
 
         def Set_mask(self, new_mask: np.ndarray, is_force: bool = True):
             _this_mask = self.mask
 
-            _is_force = is_force or not _this_mask.shape
+            _is_force = is_force or not _this_mask.size
 
-            if _is_force or all(new_mask.shape == _this_mask.shape):
-                self.mask = new_mask
+            if _is_force or new_mask.shape == _this_mask.shape:
+                _mask = new_mask.astype(bool, copy=False)
+                _keep = np.logical_not(_mask) if self.is_positive else _mask
 
-        def __call__(self, img: np.ndarray) -> np.ndarray:
-            super().__call__(img)
+                self.mask = _mask
+                self.keep = _keep[..., None]  # (h, w, 1) for broadcasting
+
+        @property
+        def is_tile_local(self) -> bool:
+            return True
+
+        def Slice(
+            self,
+            shape: tuple[int, ...],
+            top: int, bottom: int, left: int, right: int
+        ):
+            """
+            #### 전체 크기가 shape 인 이미지의 일부 영역에 대한 Masking 과정
+            ----------------------------------------------------------------
+            마스크 크기가 이미지와 다르면 (=적용 안 함) 빈 마스크 사용
+            """
             _mask = self.mask
+            _sliced = _mask[top: bottom, left: right] if (
+                _mask.shape[:2] == shape[:2]) else np.empty(0, dtype=bool)
+            return Process.Masking(_sliced, self.is_positive, self.is_inplace)
 
-            if _mask.shape[:2] == img.shape[:2]:
-                if len(img.shape) == 2:
-                    _img = img * _mask
-                else:
-                    _, _, _c = img.shape
-                    _img_list = []
-                    for _ct in range(_c):
-                        _img_list.append(img[:, :, _ct] * _mask)
+        @staticmethod
+        def _Get_alpha(dtype: np.dtype):
+            _dtype = np.dtype(dtype)
+            _max = np.iinfo(_dtype).max if (
+                _dtype.kind in "iu") else 1
+            return np.array(_max, dtype=_dtype)
 
-                    if img.shape[-1] != 4:
-                        _img_list.append(_mask)
+        @staticmethod
+        def _Pixel_view(img: np.ndarray) -> np.ndarray | None:
+            # whole pixel as one unsigned int -> one multiply per pixel
+            _byte = img.itemsize * img.shape[-1]
+            if img.flags.c_contiguous and _byte in (2, 4, 8):
+                return img.view(f"u{_byte}")[..., 0]
+            return None
 
-                    _img = np.stack(_img_list, axis=2)
-                return _img
-            return img
+        def _Apply(self, img: np.ndarray, out: np.ndarray) -> np.ndarray:
+            _keep = self.keep
+            _view = self._Pixel_view(img)
+            _out_view = None if _view is None else self._Pixel_view(out)
+
+            if _out_view is None:
+                return np.multiply(img, _keep, out=out)
+            np.multiply(_view, _keep[..., 0], out=_out_view)
+            return out
+
+        def __call__(
+            self, img: np.ndarray, out: np.ndarray | None = None
+        ) -> np.ndarray:
+            super().__call__(img)
+            _keep = self.keep
+
+            if _keep.shape[:2] != img.shape[:2]:
+                return img
+
+            _is_inplace = self.is_inplace and out is None
+
+            if img.ndim == 2:
+                return np.multiply(
+                    img, _keep[..., 0], out=img if _is_inplace else out)
+
+            _h, _w, _c = img.shape
+            if _c == 4:
+                _out = img if _is_inplace else (
+                    np.empty_like(img) if out is None else out)
+                return self._Apply(img, _out)
+
+            # add the alpha channel, then mask every channel at once
+            _out = np.empty((_h, _w, _c + 1), img.dtype) if (
+                out is None) else out
+
+            if _c == 3 and img.dtype in (np.uint8, np.uint16, np.float32):
+                cv2.cvtColor(img, cv2.COLOR_BGR2BGRA, dst=_out)
+                return self._Apply(_out, _out)
+
+            np.multiply(img, _keep, out=_out[..., :_c])
+            np.multiply(_keep[..., 0], self._Get_alpha(img.dtype),
+                        out=_out[..., _c])
+            return _out
 
     class Background_Masking(Basement):
-        def __init__(self, mode: str, is_positive: bool = False) -> None:
+        def __init__(
+            self,
+            mode: str,
+            is_positive: bool = False,
+            model_name: str | None = None,
+            intra_op_threads: int = 0,
+            inter_op_threads: int = 0
+        ) -> None:
             super().__init__()
             self.mode = mode
             self.is_positive = is_positive
 
+            self.model_name = model_name
+            self.intra_op_threads = intra_op_threads
+            self.inter_op_threads = inter_op_threads
+
         def __call__(self, img: np.ndarray) -> np.ndarray:
             super().__call__(img)
 
             if self.mode == "rembg":
-                return remove(img)
+                from rembg import remove
+
+                _session = Session_Manager.Get(
+                    self.model_name,
+                    self.intra_op_threads,
+                    self.inter_op_threads
+                )
+                return remove(img, session=_session)
             return img
 
     class Crop(Basement):
@@ -150,59 +591,365 @@ class Process():
             self.lt_point = lt_position_rate
             self.crop_shape = crop_size_rate
 
-        def __call__(self, img: np.ndarray) -> np.ndarray:
-            super().__call__(img)
+        # long side of the downscaled copy that auto crop finds edges on
+        proxy_size: int = 1024
+
+        @staticmethod
+        def _Get_gray(img: np.ndarray) -> np.ndarray:
+            if img.ndim == 3:
+                _c = img.shape[2]
+                if _c == 3:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                elif _c == 4:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+                else:
+                    img = img[..., 0]
+
+            if img.dtype == np.uint8:
+                return img
+            if img.dtype == np.uint16:
+                return (img >> 8).astype(np.uint8)
+            if img.dtype.kind == "f":
+                return cv2.convertScaleAbs(img, alpha=255)
+            return cv2.convertScaleAbs(img)
+
+        @staticmethod
+        def _Get_range(
+            count: np.ndarray, scale: float, limit: int
+        ) -> tuple[int, int]:
+            # mean and std of the edge positions from the projection
+            _total = count.sum()
+            _pos = np.arange(len(count), dtype=np.float64)
+            _mean = (count @ _pos) / _total
+            _std = np.sqrt((count @ (_pos - _mean) ** 2) / _total)
+
+            # proxy pixel center -> full resolution position
+            _mean = (_mean + 0.5) * scale - 0.5
+            _std = _std * scale
+            return (
+                max(round(_mean - 2 * _std), 0),
+                min(round(_mean + 2 * _std), limit)
+            )
+
+        def _Get_auto_box(
+            self, img: np.ndarray
+        ) -> tuple[int, int, int, int] | None:
             _h, _w = img.shape[:2]
-            if self.is_auto:
-                _gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-                _m: float = _gray.mean().item()
-                _std: float = _gray.std().item()
+            if not (_h and _w):
+                return None
 
-                _high = min(round((_m + _std)), 255)
-                _low = max(round(_m - _std), 0)
+            # find edges on a small copy, the cost doesn't grow with the size
+            # (integer factor: the fast path of INTER_AREA)
+            _k = max(-(-max(_h, _w) // self.proxy_size), 1)
+            _p_h, _p_w = max(_h // _k, 1), max(_w // _k, 1)
+            _proxy = img if _k == 1 else cv2.resize(
+                img[:_p_h * _k, :_p_w * _k], (_p_w, _p_h),
+                interpolation=cv2.INTER_AREA)
+            _gray = self._Get_gray(_proxy)
 
-                _y, _x = np.where(cv2.Canny(_gray, _high, _low) != 0)
+            _m: float = _gray.mean().item()
+            _std: float = _gray.std().item()
+            _high = min(round((_m + _std)), 255)
+            _low = max(round(_m - _std), 0)
 
-                _x_mean = _x.mean()
-                _x_term = _x.std()
-                _l = max(round(_x_mean - 2 * _x_term), 0)
-                _r = min(round(_x_mean + 2 * _x_term), _w)
+            _edge = cv2.Canny(_gray, _high, _low) != 0
+            _col = np.count_nonzero(_edge, axis=0)
+            if not _col.any():  # no edge -> nothing to crop
+                return None
+            _row = np.count_nonzero(_edge, axis=1)
 
-                _y_mean = _y.mean()
-                _y_term = _y.std()
-                _t = max(round(_y_mean - 2 * _y_term), 0)
-                _b = min(round(_y_mean + 2 * _y_term), _h)
+            _l, _r = self._Get_range(_col, _k, _w)
+            _t, _b = self._Get_range(_row, _k, _h)
+            if _l >= _r or _t >= _b:
+                return None
+            return _t, _l, _b, _r
+
+        def __call__(self, img: np.ndarray) -> np.ndarray:
+            super().__call__(img)
+            if self.is_auto:
+                _box = self._Get_auto_box(img)
+                if _box is None:
+                    return img
+                _t, _l, _b, _r = _box
 
                 return img[_t: _b, _l: _r]
 
             else:
-                _lt_w_rate, _lt_h_rate = self.lt_point
-                _lt_w = round(_lt_w_rate * _w)
-                _lt_h = round(_lt_h_rate * _h)
-                _c_w_rate, _c_h_rate = self.crop_shape
-                _rb_w = min(_lt_w + _w * _c_w_rate, _w - 1)
-                _rb_h = min(_lt_h + _h * _c_h_rate, _h - 1)
+                _lt_h, _lt_w, _rb_h, _rb_w = self._Get_box(img.shape)
 
                 return img[_lt_h: _rb_h, _lt_w: _rb_w]
 
+        def _Get_box(self, shape: tuple[int, ...]):
+            _h, _w = shape[:2]
+
+            _lt_w_rate, _lt_h_rate = self.lt_point
+            _lt_w = round(_lt_w_rate * _w)
+            _lt_h = round(_lt_h_rate * _h)
+            _c_w_rate, _c_h_rate = self.crop_shape
+            _rb_w = min(_lt_w + round(_w * _c_w_rate), _w)
+            _rb_h = min(_lt_h + round(_h * _c_h_rate), _h)
+
+            return _lt_h, _lt_w, _rb_h, _rb_w
+
+        @property
+        def is_affine(self) -> bool:
+            return not self.is_auto
+
+        def Get_affine(self, shape: tuple[int, ...]):
+            _lt_h, _lt_w, _rb_h, _rb_w = self._Get_box(shape)
+            _m = np.array([[1, 0, -_lt_w], [0, 1, -_lt_h], [0, 0, 1]])
+
+            return _m, (max(_rb_h - _lt_h, 0), max(_rb_w - _lt_w, 0))
+
+    class Warp(Basement):
+        """
+        #### 연속된 기하 변환 과정 (Resize, Rotate, Flip, Crop) 을
+        #### 하나의 행렬로 합쳐 한 번의 warpAffine 으로 처리
+        ----------------------------------------------------------------
+        """
+        def __init__(self, steps: list[Process.Basement]) -> None:
+            super().__init__()
+            self.steps = steps
+
+            # rotate samples outside of its input (no crop comes before it,
+            # see `Apply_Block.Compile`)
+            self.border = cv2.BORDER_CONSTANT if any(
+                _step.border == cv2.BORDER_CONSTANT for _step in steps
+            ) else cv2.BORDER_REPLICATE
+
+            # the steps agree (see `Apply_Block.Compile`), area wins over
+            # the linear of rotate
+            _flags = {
+                _step.warp_interpolation for _step in steps
+            } - {None}
+            self.interpolation: int | None = cv2.INTER_AREA if (
+                cv2.INTER_AREA in _flags) else next(iter(_flags), None)
+
+        @property
+        def warp_interpolation(self) -> int | None:
+            return self.interpolation
+
+        @staticmethod
+        def Get_flag(interpolation: int | None) -> tuple[int, bool]:
+            """ 보간 방법 -> (warpAffine 의 flag, area 로 미리 줄일지 여부) """
+            if interpolation is None or interpolation == cv2.INTER_AREA:
+                return cv2.INTER_LINEAR, interpolation is not None
+            return interpolation, False
+
+        @staticmethod
+        def Get_prefilter(m: np.ndarray) -> int:
+            """
+            #### 변환 전에 area 로 미리 줄일 정수 배율 (1: 그대로)
+            ----------------------------------------------------------------
+            2 배 넘게 줄이는 변환은 보간만으로는 계단 현상이 생긴다.
+            미리 줄인 뒤 남는 축소는 2 배 미만
+            """
+            # input pixels per output pixel, along the output axes
+            _inv = np.linalg.inv(m[:2, :2])
+            _ratio = float(np.hypot(_inv[0], _inv[1]).min())
+            return int(_ratio) if _ratio >= 2 else 1
+
+        @staticmethod
+        def Prefilter(
+            img: np.ndarray, m: np.ndarray, scale: int
+        ) -> tuple[np.ndarray, np.ndarray]:
+            """
+            #### 정수 배율 area 축소와, 줄인 이미지에 맞춘 변환 행렬
+            ----------------------------------------------------------------
+            배율로 나누어 떨어지지 않는 끝 픽셀은 버림
+            """
+            _h, _w = img.shape[0] // scale, img.shape[1] // scale
+            if not (_h and _w):
+                return img, m
+
+            # integer factor: the fast path of INTER_AREA
+            _small = cv2.resize(
+                img[:_h * scale, :_w * scale], (_w, _h),
+                interpolation=cv2.INTER_AREA)
+            _center = (scale - 1) / 2
+            return _small.reshape(_h, _w, *img.shape[2:]), m @ np.array([
+                [scale, 0, _center],
+                [0, scale, _center],
+                [0, 0, 1]
+            ])
+
+        @staticmethod
+        def Apply(
+            img: np.ndarray,
+            m: np.ndarray,
+            shape: tuple[int, int],
+            flag: int,
+            border: int
+        ) -> np.ndarray:
+            """ 3x3 행렬 m 으로 (h, w) 크기의 출력을 만듦 """
+            if flag == cv2.INTER_NEAREST:
+                # nudge the source position past the fixed point error,
+                # so ties pick the same pixel with or without a flip
+                _nudge = -1 / 128
+                m = m @ np.array([[1, 0, _nudge], [0, 1, _nudge], [0, 0, 1]])
+            return cv2.warpAffine(
+                img, m[:2], shape[::-1], flags=flag, borderMode=border)
+
+        @property
+        def is_affine(self) -> bool:
+            return True
+
+        def Get_affine(self, shape: tuple[int, ...]):
+            _m = np.eye(3)
+            _shape = shape
+
+            for _step in self.steps:
+                _step_m, _to_shape = _step.Get_affine(_shape)
+                _m = _step_m @ _m
+                _shape = (*_to_shape, *_shape[2:])
+            return _m, _shape[:2]
+
+        def __call__(self, img: np.ndarray) -> np.ndarray:
+            super().__call__(img)
+            _m, (_h, _w) = self.Get_affine(img.shape)
+
+            if _h <= 0 or _w <= 0:
+                return img[:0, :0]
+
+            _flag, _is_prefiltered = self.Get_flag(self.interpolation)
+            _scale = self.Get_prefilter(_m) if _is_prefiltered else 1
+            if _scale > 1:
+                img, _m = self.Prefilter(img, _m, _scale)
+            return self.Apply(img, _m, (_h, _w), _flag, self.border)
+
 
 class Apply_Block():
+    # decoded image shared by every block (key: file path)
+    image_cache = Image_Cache(1 << 30)
+    # intermediate result of each step (key: block, input, step chain)
+    step_cache = Image_Cache(1 << 31)
+    # arrays without a source file (results not written yet), spill to disk
+    image_store = Image_Store(1 << 30)
+    _serial = count()
+
     def __init__(
         self,
         save_dir: str,
         file_name: str,
-        input_img: np.ndarray
+        input_img: np.ndarray | str,
+        is_fused: bool = True,
+        is_cached: bool = True,
+        result_cache: Result_Cache | None = None
     ) -> None:
         self.save_dir: str = save_dir
         self.file_name = file_name
 
-        self.input_img = input_img
-        self.output_img: np.ndarray = np.empty(0)
+        # file path that is decoded when it is needed, or handle of an array
+        # in the image store (empty array: no image)
+        self._input_img: Image_Handle | np.ndarray | str = self._Hold(
+            input_img)
+        self._output_img: Image_Handle | np.ndarray | str = np.empty(0)
 
         self.process_list: list[Process.Basement] = []
-        self.change_log: list[bool]
 
-    def Set_process(self, process_list: list[dict[str, Any]]):
+        # process list that actually runs (geometric steps are fused)
+        self.is_fused = is_fused
+        self.compiled_list: list[Process.Basement] = []
+        self.compiled_ends: list[int] = []
+
+        # reuse the result of unchanged steps
+        self.is_cached = is_cached
+        self.step_keys: list[str] = []
+        self._id = next(self._serial)
+        self._input_version = 0
+
+        # skip the whole run if the input and the recipe are not changed
+        self.result_cache = result_cache
+        self.result_entry: dict[str, Any] | None = None
+        self.is_skipped = False
+
+        # decoded input handed over from a reader thread
+        self._prefetched: np.ndarray | None = None
+
+    @classmethod
+    def _Hold(
+        cls, img: Image_Handle | np.ndarray | str
+    ) -> Image_Handle | np.ndarray | str:
+        if isinstance(img, np.ndarray) and img.size:
+            return cls.image_store.Hold(img)
+        return img
+
+    @classmethod
+    def _Load(cls, img: Image_Handle | np.ndarray | str) -> np.ndarray:
+        if isinstance(img, str):
+            _img = cls.image_cache.Get(img, lambda: Process.Read(img))
+            return np.empty(0) if _img is None else _img
+        if isinstance(img, Image_Handle):
+            return img.Get()
+        return img
+
+    @property
+    def input_img(self) -> np.ndarray:
+        return self._Load(self._input_img)
+
+    @input_img.setter
+    def input_img(self, img: Image_Handle | np.ndarray | str):
+        self._input_img = self._Hold(img)
+        self._input_version += 1  # cached steps belong to the old input
+        self.result_entry = None
+        self._prefetched = None
+
+    @property
+    def input_file(self) -> str | None:
+        _img = self._input_img
+        return _img if isinstance(_img, str) else None
+
+    @property
+    def output_file(self) -> str | None:
+        _img = self._output_img
+        return _img if isinstance(_img, str) else None
+
+    @property
+    def output_img(self) -> np.ndarray:
+        return self._Load(self._output_img)
+
+    @output_img.setter
+    def output_img(self, img: Image_Handle | np.ndarray | str):
+        self._output_img = self._Hold(img)
+
+    def Get_output_shape(self) -> tuple[int, ...] | None:
+        _img = self._output_img
+        if isinstance(_img, str):
+            return Process.Read_shape(_img)
+        _shape = _img.shape
+        return _shape if len(_shape) >= 2 else None
+
+    @staticmethod
+    def Get_step_keys(process_list: list[dict[str, Any]]) -> list[str]:
+        """
+        #### 각 과정까지의 과정 정보를 누적한 키 목록
+        ----------------------------------------------------------------
+        k 번째 과정이 바뀌면 k 번째 이후의 키가 모두 바뀐다.
+        """
+        _keys: list[str] = []
+        _chain = ""
+
+        for _process in process_list:
+            _chain = sha1(
+                (_chain + Get_process_key(_process)).encode("UTF-8")
+            ).hexdigest()
+            _keys.append(_chain)
+        return _keys
+
+    @staticmethod
+    def Get_recipe_key(process_list: list[dict[str, Any]]) -> str:
+        _keys = Apply_Block.Get_step_keys(process_list)
+        return _keys[-1] if _keys else ""
+
+    @property
+    def recipe_key(self) -> str:
+        return self.step_keys[-1] if self.step_keys else ""
+
+    def Set_process(
+        self,
+        process_list: list[dict[str, Any]],
+        step_keys: list[str] | None = None
+    ):
         _process_list: list[Process.Basement] = []
 
         for _process in process_list:
@@ -213,20 +960,201 @@ class Apply_Block():
                 Process.__dict__[_process_name](**_process_kwarg)
             )
 
+        # the same list for every block -> make the keys once and pass them
+        _keys = self.Get_step_keys(process_list) if (
+            step_keys is None) else step_keys
+
         self.process_list = _process_list
-        self.change_log = [
-            True for _p in process_list
-        ]
+        self.step_keys = _keys
+        self.result_entry = None
+
+        if self.is_fused:
+            self.compiled_list, self.compiled_ends = self.Compile(
+                _process_list)
+        else:
+            self.compiled_list = _process_list
+            self.compiled_ends = list(range(len(_process_list)))
+
+    @staticmethod
+    def Compile(
+        process_list: list[Process.Basement]
+    ) -> tuple[list[Process.Basement], list[int]]:
+        """
+        #### 연속된 기하 변환 과정을 하나의 Warp 과정으로 병합
+        ----------------------------------------------------------------
+        병합된 과정 목록과, 각 과정이 끝나는 원래 과정의 위치를 반환
+        """
+        _compiled: list[Process.Basement] = []
+        _ends: list[int] = []
+        _run: list[Process.Basement] = []
+
+        def _Flush(end: int):
+            if len(_run) > 1:
+                _compiled.append(Process.Warp(list(_run)))
+                _ends.append(end)
+            else:
+                _compiled.extend(_run)
+                _ends.extend([end] * len(_run))
+            _run.clear()
+
+        for _ct, _process in enumerate([*process_list, None]):
+            if _process is not None and _process.is_affine:
+                if not Apply_Block._Is_fusible(_run, _process):
+                    _Flush(_ct - 1)
+                _run.append(_process)
+                continue
+
+            _Flush(_ct - 1)
+            if _process is not None:
+                _compiled.append(_process)
+                _ends.append(_ct)
+
+        return _compiled, _ends
+
+    @staticmethod
+    def _Is_fusible(
+        run: list[Process.Basement], process: Process.Basement
+    ) -> bool:
+        # a step that samples outside of its input would read, through one
+        # matrix, the pixels that an earlier crop has cut off
+        # (step by step, they are the border)
+        if process.border == cv2.BORDER_CONSTANT and any(
+            isinstance(_step, Process.Crop) for _step in run
+        ):
+            return False
+
+        # one warp has one interpolation. rotate doesn't scale, so its
+        # linear goes with the area prefilter of a resize (not with a
+        # resize that asks for linear)
+        _steps = [*run, process]
+        _flags = {_step.warp_interpolation for _step in _steps} - {None}
+        if len(_flags) <= 1:
+            return True
+        return _flags == {cv2.INTER_LINEAR, cv2.INTER_AREA} and not any(
+            isinstance(_step, Process.Resize)
+            and _step.warp_interpolation == cv2.INTER_LINEAR
+            for _step in _steps)
+
+    def _Cache_key(self, step_key: str):
+        return self._id, self._input_version, step_key
+
+    def _Finish_write(self, handle: Image_Handle):
+        # drop the decoded old result of the same file
+        _file = Path.Join(self.file_name, self.save_dir)
+        self.image_cache.Pop(_file)
+
+        # the written file replaces the array (unless it is run again)
+        if self._output_img is handle:
+            self._output_img = _file
+            handle.Release()
+
+        if self.result_cache is not None and self.result_entry is not None:
+            self.result_cache.Update(self.file_name, self.result_entry)
+
+    def Write(self, is_async: bool = False) -> Future | None:
+        """
+        #### 결과 저장 (is_async 면 백그라운드에서 인코딩하고 Future 반환)
+        ----------------------------------------------------------------
+        저장이 끝나면 결과 배열 대신 저장한 파일 경로를 들고 있는다.
+        """
+        _handle = self._output_img
+        if not isinstance(_handle, Image_Handle):  # nothing new to write
+            return None
+        _img = _handle.Get()
+
+        if not is_async:
+            Process.Write(_img, self.save_dir, self.file_name)
+            self._Finish_write(_handle)
+            return None
+
+        return Process.writer.Submit(
+            _img, Path.Join(self.file_name, self.save_dir),
+            lambda: self._Finish_write(_handle))
+
+    def Check_result(self) -> bool:
+        """
+        #### 입력과 처리 과정이 저장된 결과와 같으면 건너뛰도록 표시
+        ----------------------------------------------------------------
+        """
+        _result_cache = self.result_cache
+        self.is_skipped = False
+        if _result_cache is None:
+            return False
+
+        with Tracer.Span("Check_result", "io", self.input_file):
+            self.result_entry = _result_cache.Make_entry(
+                self.file_name, self.input_file or self.input_img,
+                self.recipe_key)
+        if _result_cache.Is_hit(self.file_name, self.result_entry):
+            self.output_img = Path.Join(self.file_name, self.save_dir)
+            self.is_skipped = True
+            # the stat is renewed if the input file is only touched
+            _result_cache.Update(self.file_name, self.result_entry)
+        return self.is_skipped
+
+    def Read(self) -> np.ndarray:
+        _file = self.input_file
+        # a one-off run doesn't keep the decoded input in the shared cache
+        _img = self.input_img if (
+            self.is_cached or _file is None) else Process.Read(_file)
+        if _img is None or not _img.size:
+            raise ValueError("can't decode the image")
+        return _img
+
+    def Prefetch(self):
+        """
+        #### 처리 전에 입력을 미리 디코딩 (다른 스레드에서 호출 가능)
+        ----------------------------------------------------------------
+        """
+        self._prefetched = self.Read()
+
+    def __call__(self, is_write: bool = True):
+        with Tracer.Span("Apply_Block", "image", file_name=self.file_name):
+            if self.result_entry is None and self.Check_result():
+                return
+            if self.is_skipped:
+                return
+
+            self.Run()
+            if is_write:
+                self.Write()
+
+    def Run(self):
+        _this_process = self.compiled_list
+        _keys = [self.step_keys[_end] for _end in self.compiled_ends]
+        _is_cached = self.is_cached
+        _cache = self.step_cache
+
+        # start after the last step whose result is still cached
+        _start = 0
+        _this_img = None
+        if _is_cached:
+            for _ct in range(len(_keys) - 1, -1, -1):
+                _this_img = _cache.Get(self._Cache_key(_keys[_ct]))
+                if _this_img is not None:
+                    _start = _ct + 1
+                    break
+
+        if _this_img is None:
+            _this_img = self._prefetched if (
+                self._prefetched is not None) else self.Read()
+        self._prefetched = None
+
+        for _ct in range(_start, len(_this_process)):
+            _process = _this_process[_ct]
+            _input = _this_img
 
-    def Write(self):
-        Process.Write(self.output_img, self.save_dir, self.file_name)
+            if _is_cached and getattr(_process, "is_inplace", False):
+                _this_img = _this_img.copy()  # keep the cached one intact
 
-    def __call__(self):
-        _this_img = self.input_img
-        _this_process = self.process_list
+            _span = Tracer.Span(type(_process).__name__, "step", _this_img)
+            with _span:
+                _this_img = _process(_this_img)
+                _span.Set_output(_this_img)
 
-        for _process in _this_process:
-            _this_img = _process(_this_img)
+            # a step that returns its input (nothing to do) is not stored
+            # again, the same array is already cached or read
+            if _is_cached and _this_img is not _input:
+                _cache.Put(self._Cache_key(_keys[_ct]), _this_img)
 
         self.output_img = _this_img
-        self.Write()
@@ -0,0 +1,160 @@
+""" ### Image encoder with per format options and background writing
+
+------------------------------------------------------------------------
+### Requirement
+    numpy, opencv
+
+### Structure
+    Image_Writer: encode with the options of each format, write through
+        a temp file and rename, and optionally run on a thread pool.
+
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, Future
+from os import path, replace, remove, makedirs
+from threading import Lock
+from typing import Any, Callable
+
+import numpy as np
+import cv2
+
+from utils.trace import Tracer
+
+
+PNG_STRATEGY: dict[str, int] = {
+    "default": cv2.IMWRITE_PNG_STRATEGY_DEFAULT,
+    "filtered": cv2.IMWRITE_PNG_STRATEGY_FILTERED,
+    "huffman_only": cv2.IMWRITE_PNG_STRATEGY_HUFFMAN_ONLY,
+    "rle": cv2.IMWRITE_PNG_STRATEGY_RLE,
+    "fixed": cv2.IMWRITE_PNG_STRATEGY_FIXED
+}
+FORMAT_ALIAS: dict[str, str] = {"jpeg": "jpg", "jpe": "jpg", "tif": "tiff"}
+DEFAULT_OPTION: dict[str, dict[str, Any]] = {
+    "png": {"compression": 1, "strategy": "default"},
+    "jpg": {"quality": 95, "progressive": False, "optimize": False},
+    "webp": {"quality": 95}
+}
+
+
+class Image_Writer():
+    """ ### 형식 별 인코딩 설정으로 이미지를 저장
+
+    임시 파일에 먼저 쓰고 이름을 바꾸기 때문에 다른 곳에서
+    절반만 저장된 파일을 읽는 일이 없다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `option`: 형식 별 설정 (기본 값 `DEFAULT_OPTION` 에 덮어씀)
+        - png: `compression` (0 ~ 9), `strategy` (`PNG_STRATEGY` 의 키)
+        - jpg: `quality` (0 ~ 100), `progressive`, `optimize`
+        - webp: `quality` (1 ~ 100)
+    - `worker_num`: `Submit` 에서 사용할 인코딩 스레드 수
+
+    """
+    def __init__(
+        self,
+        option: dict[str, dict[str, Any]] | None = None,
+        worker_num: int = 2
+    ) -> None:
+        self.option: dict[str, dict[str, Any]] = {
+            _format: dict(_default) for _format, _default in (
+                DEFAULT_OPTION.items())
+        }
+        for _format, _option in (option or {}).items():
+            self.option.setdefault(
+                self.Get_format(_format), {}).update(_option)
+
+        self.worker_num = worker_num
+        self._pool: ThreadPoolExecutor | None = None
+        self._lock = Lock()
+
+    @staticmethod
+    def Get_format(file_name: str) -> str:
+        _format = file_name.rsplit(".", 1)[-1].lower()
+        return FORMAT_ALIAS.get(_format, _format)
+
+    def Get_params(self, img_format: str) -> list[int]:
+        """
+        #### 형식에 맞는 cv2.imencode 인자 목록
+        ----------------------------------------------------------------
+        """
+        _format = self.Get_format(img_format)
+        _option = self.option.get(_format, {})
+
+        if _format == "png":
+            return [
+                cv2.IMWRITE_PNG_COMPRESSION, int(_option["compression"]),
+                cv2.IMWRITE_PNG_STRATEGY, PNG_STRATEGY[_option["strategy"]]
+            ]
+        if _format == "jpg":
+            return [
+                cv2.IMWRITE_JPEG_QUALITY, int(_option["quality"]),
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(_option["progressive"]),
+                cv2.IMWRITE_JPEG_OPTIMIZE, int(_option["optimize"])
+            ]
+        if _format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, int(_option["quality"])]
+        return []
+
+    def Encode(self, img: np.ndarray, img_format: str) -> np.ndarray:
+        _format = self.Get_format(img_format)
+        _is_done, _buffer = cv2.imencode(
+            f".{_format}", img, self.Get_params(_format))
+        if not _is_done:
+            raise ValueError(f"can't encode the image as {_format}")
+        return _buffer
+
+    def Write(self, img: np.ndarray, file_path: str) -> str:
+        with Tracer.Span("Write", "io", img, file=file_path) as _span:
+            _buffer = self.Encode(img, file_path)
+            _span.Set_output(_buffer)
+
+            # write to temp file then rename, so readers never see half
+            _dir, _name = path.split(file_path)
+            if _dir and not path.isdir(_dir):  # sub directory of recursive
+                makedirs(_dir, exist_ok=True)
+            _temp = path.join(_dir, f".{_name}.tmp")
+            try:
+                with open(_temp, "wb") as _file:
+                    _file.write(_buffer.data)
+                replace(_temp, file_path)
+            except OSError:
+                if path.exists(_temp):
+                    remove(_temp)
+                raise
+        return file_path
+
+    def _Write_n_call(
+        self,
+        img: np.ndarray,
+        file_path: str,
+        on_written: Callable[[], Any] | None
+    ) -> str:
+        self.Write(img, file_path)
+        if on_written is not None:
+            on_written()
+        return file_path
+
+    def Submit(
+        self,
+        img: np.ndarray,
+        file_path: str,
+        on_written: Callable[[], Any] | None = None
+    ) -> Future:
+        """
+        #### 백그라운드 스레드에서 저장 (배열은 저장이 끝날 때까지 수정 금지)
+        ----------------------------------------------------------------
+        `on_written` 은 저장에 성공하면 Future 가 끝나기 전에 호출된다.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max(self.worker_num, 1), "image_writer")
+            _pool = self._pool
+        return _pool.submit(self._Write_n_call, img, file_path, on_written)
+
+    def Close(self, wait: bool = True):
+        with self._lock:
+            _pool, self._pool = self._pool, None
+        if _pool is not None:
+            _pool.shutdown(wait)
@@ -0,0 +1,153 @@
+""" ### Bounded producer / consumer pipeline of thread stages
+
+------------------------------------------------------------------------
+### Requirement
+    None
+
+### Structure
+    Stage: one step of the pipeline with its own worker threads and queue
+    Pipeline: chain the stages with bounded queues and yield the results
+
+    Decoding, processing and encoding in opencv release the GIL, so the
+    stages overlap disk / network waits with compute in one process.
+
+"""
+from __future__ import annotations
+from queue import Queue
+from threading import Thread, Lock
+from typing import Any, Callable, Iterable, Iterator
+
+
+_END = object()  # sentinel that closes a stage
+
+
+class Failure():
+    """ ### 앞 과정에서 실패한 항목 (이후 과정은 건너뛰고 그대로 전달)
+    """
+    def __init__(self, item: Any, stage: str, error: Exception) -> None:
+        self.item = item
+        self.stage = stage
+        self.error = error
+
+
+class Stage():
+    """ ### 파이프라인의 한 과정
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `name`: 과정 이름 (대기열 길이 보고에 사용)
+    - `func`: 앞 과정의 결과를 받아 다음 과정으로 넘길 값을 반환하는 함수
+    - `worker_num`: 이 과정을 동시에 실행할 스레드 수
+    - `queue_size`: 이 과정 앞 대기열의 최대 길이 (0 이하면 worker_num * 2)
+
+    """
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        worker_num: int = 1,
+        queue_size: int = 0
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.worker_num = max(worker_num, 1)
+
+        self.queue: Queue = Queue(
+            queue_size if queue_size > 0 else self.worker_num * 2)
+        self.max_depth = 0
+
+
+class Pipeline():
+    """ ### 대기열 길이가 제한된 다단계 생산자 / 소비자 파이프라인
+
+    입력 순서와 상관없이 끝난 순서대로 결과를 반환한다.
+    과정에서 예외가 발생한 항목은 `Failure` 로 감싸 마지막까지 전달한다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `stages`: 순서대로 실행할 과정 목록
+    - `result_size`: 결과 대기열의 최대 길이
+
+    """
+    def __init__(self, stages: list[Stage], result_size: int = 0) -> None:
+        self.stages = stages
+        self.result_queue: Queue = Queue(result_size)
+
+        self._lock = Lock()
+        self._alive: list[int] = [_stage.worker_num for _stage in stages]
+
+    def Get_depth(self) -> dict[str, int]:
+        """
+        #### 각 과정 앞 대기열에 쌓여 있는 항목 수
+        ----------------------------------------------------------------
+        """
+        return {_stage.name: _stage.queue.qsize() for _stage in self.stages}
+
+    def Get_max_depth(self) -> dict[str, int]:
+        return {_stage.name: _stage.max_depth for _stage in self.stages}
+
+    def _Get_next_queue(self, ct: int) -> tuple[Queue, int]:
+        _stages = self.stages
+        if ct + 1 < len(_stages):
+            _next = _stages[ct + 1]
+            return _next.queue, _next.worker_num
+        return self.result_queue, 1
+
+    def _Work(self, ct: int):
+        _stage = self.stages[ct]
+        _queue = _stage.queue
+        _next_queue, _next_num = self._Get_next_queue(ct)
+
+        while True:
+            _item = _queue.get()
+            if _item is _END:
+                break
+            _stage.max_depth = max(_stage.max_depth, _queue.qsize() + 1)
+
+            if not isinstance(_item, Failure):
+                try:
+                    _item = _stage.func(_item)
+                except Exception as _error:  # pass it to the end
+                    _item = Failure(_item, _stage.name, _error)
+            _next_queue.put(_item)
+
+        # the last worker of the stage closes the next one
+        with self._lock:
+            self._alive[ct] -= 1
+            _is_last = self._alive[ct] == 0
+        if _is_last:
+            for _ in range(_next_num):
+                _next_queue.put(_END)
+
+    def _Feed(self, items: Iterable[Any]):
+        _stage = self.stages[0]
+        _queue = _stage.queue
+        for _item in items:
+            _queue.put(_item)
+        for _ in range(_stage.worker_num):
+            _queue.put(_END)
+
+    def Run(self, items: Iterable[Any]) -> Iterator[Any]:
+        _threads = [Thread(target=self._Feed, args=(items,), daemon=True)]
+        for _ct, _stage in enumerate(self.stages):
+            _threads += [
+                Thread(
+                    target=self._Work, args=(_ct,), daemon=True,
+                    name=f"{_stage.name}_{_id}")
+                for _id in range(_stage.worker_num)
+            ]
+
+        with self._lock:
+            self._alive = [_stage.worker_num for _stage in self.stages]
+        for _thread in _threads:
+            _thread.start()
+
+        _result_queue = self.result_queue
+        while True:
+            _item = _result_queue.get()
+            if _item is _END:
+                break
+            yield _item
+
+        for _thread in _threads:
+            _thread.join()
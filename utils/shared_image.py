@@ -0,0 +1,329 @@
+""" ### Shared memory transport of image arrays between processes
+
+------------------------------------------------------------------------
+### Requirement
+    numpy
+
+### Structure
+    Shared_Image: picklable address (name, shape, dtype) of an array in
+        a shared memory segment.
+    Image_Transport: put arrays in shared memory (small ones are pickled
+        as they are) and own the segments until they are released.
+    Shared_Result: output of a worker, a view of its segment until it is
+        released.
+    Parallel_Apply: run `Apply_Block` over in-memory images on worker
+        processes. Workers read the input and write the output through
+        shared memory, so no full image is pickled either way.
+        (`batch.py --engine shared`)
+
+    Segments are unlinked only by the `Image_Transport` that created or
+    adopted them. Arrays given by `Unpack` / `Shared_Result` are views
+    of the segment, so copy what must outlive the release.
+    A worker keeps its output segment open until the parent marks it as
+    attached (one byte after the data), since on Windows a segment is
+    gone when its last handle is closed.
+
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from os import cpu_count
+from threading import Lock
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+
+# output segments of this worker, closed after the parent attaches them
+_held: dict[str, tuple[SharedMemory, int]] = {}
+
+
+class Shared_Image():
+    """ ### 공유 메모리에 올린 배열의 주소 (pickle 로 다른 프로세스에 전달)
+    """
+    def __init__(self, name: str, shape: tuple[int, ...], dtype: str) -> None:
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    def Open(self) -> tuple[SharedMemory, np.ndarray]:
+        """
+        #### 공유 메모리에 붙어서 복사 없이 배열로 보기
+        ----------------------------------------------------------------
+        반환된 배열을 모두 버린 뒤에 SharedMemory 를 close 해야 한다.
+        """
+        _memory = SharedMemory(self.name)
+        return _memory, np.ndarray(self.shape, self.dtype, _memory.buf)
+
+
+def Share(img: np.ndarray) -> tuple[SharedMemory, Shared_Image]:
+    """
+    #### 새 공유 메모리에 배열을 복사 (unlink 는 받는 쪽 책임)
+    ----------------------------------------------------------------
+    """
+    # one more byte for the attached flag
+    _memory = SharedMemory(create=True, size=img.nbytes + 1)
+    _view = np.ndarray(img.shape, img.dtype, _memory.buf)
+    _view[...] = img
+    del _view
+    _memory.buf[img.nbytes] = 0
+    return _memory, Shared_Image(_memory.name, img.shape, img.dtype.str)
+
+
+def _Close_memory(memory: SharedMemory):
+    try:
+        memory.close()
+    except BufferError:  # a view is still alive, freed with the view
+        pass
+
+
+def _Close_attached():
+    for _name, (_memory, _flag) in list(_held.items()):
+        if _memory.buf[_flag]:
+            del _held[_name]
+            _Close_memory(_memory)
+
+
+class Image_Transport():
+    """ ### 큰 배열은 공유 메모리로, 작은 배열은 pickle 로 전달
+
+    만들거나 넘겨받은 공유 메모리는 `Release` 나 `Close` 로 지울 때까지
+    이 객체가 들고 있다. with 문으로 쓰면 끝날 때 모두 지운다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `min_bytes`: 공유 메모리로 보낼 최소 배열 크기 (작으면 pickle 이 빠름)
+
+    """
+    def __init__(self, min_bytes: int = 1 << 20) -> None:
+        self.min_bytes = min_bytes
+        self.segments: dict[str, SharedMemory] = {}
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+        return False
+
+    def Pack(self, img: np.ndarray) -> Shared_Image | np.ndarray:
+        if img.nbytes < self.min_bytes:
+            return img
+
+        try:
+            _memory, _packet = Share(img)
+        except OSError:  # no room in shared memory, pickle instead
+            return img
+        with self._lock:
+            self.segments[_packet.name] = _memory
+        return _packet
+
+    def Unpack(self, packet: Shared_Image | np.ndarray) -> np.ndarray:
+        """
+        #### 다른 프로세스가 만든 공유 메모리를 넘겨받아 배열로 보기
+        ----------------------------------------------------------------
+        """
+        if not isinstance(packet, Shared_Image):
+            return packet
+
+        with self._lock:
+            _memory = self.segments.get(packet.name)
+        if _memory is None:
+            _memory = SharedMemory(packet.name)
+            _memory.buf[packet.nbytes] = 1  # the sender may close it now
+            with self._lock:
+                self.segments[packet.name] = _memory
+        return np.ndarray(packet.shape, packet.dtype, _memory.buf)
+
+    def Release(self, packet: Shared_Image | np.ndarray):
+        if not isinstance(packet, Shared_Image):
+            return
+        with self._lock:
+            _memory = self.segments.pop(packet.name, None)
+        if _memory is not None:
+            _memory.unlink()
+            _Close_memory(_memory)
+
+    def Close(self):
+        with self._lock:
+            _segments, self.segments = self.segments, {}
+        for _memory in _segments.values():
+            _memory.unlink()
+            _Close_memory(_memory)
+
+
+def _Run_shared(
+    file_name: str,
+    packet: Shared_Image | np.ndarray,
+    process_list: list[dict[str, Any]],
+    min_bytes: int
+) -> Shared_Image | np.ndarray:
+    from utils.image_process import Apply_Block
+
+    _Close_attached()
+    _memory = None
+    if isinstance(packet, Shared_Image):
+        _memory, _img = packet.Open()
+    else:
+        _img = packet
+
+    try:
+        _block = Apply_Block("", file_name, _img, is_cached=False)
+        _block.Set_process(process_list)
+        _block(is_write=False)
+        _output = _block.output_img
+        del _block, _img  # drop every view before closing
+
+        if _output.nbytes < min_bytes:
+            return np.array(_output)  # may be a view of the input
+        try:
+            _out_memory, _out_packet = Share(_output)
+        except OSError:  # no room in shared memory, pickle instead
+            return np.array(_output)
+        del _output
+        # the parent adopts and unlinks it
+        _held[_out_packet.name] = (_out_memory, _out_packet.nbytes)
+        return _out_packet
+    finally:
+        if _memory is not None:
+            _Close_memory(_memory)
+
+
+class Shared_Result():
+    """ ### 작업 프로세스의 처리 결과 (공유 메모리의 view)
+
+    결과를 다 쓴 뒤 `Release` (또는 with 문) 로 공유 메모리를 지운다.
+    지운 뒤에는 `img` 를 쓰면 안 된다.
+    """
+    def __init__(
+        self, transport: Image_Transport, packet: Shared_Image | np.ndarray
+    ) -> None:
+        self.transport = transport
+        self.packet = packet
+        self.img: np.ndarray | None = transport.Unpack(packet)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Release()
+        return False
+
+    def Release(self):
+        self.img = None  # drop the view before closing the segment
+        self.transport.Release(self.packet)
+
+
+class Parallel_Apply():
+    """ ### 메모리에 있는 이미지들을 여러 프로세스에서 처리
+
+    입력과 결과 모두 공유 메모리로 주고받는다.
+    결과는 `Shared_Result` 로 받고, 다 쓰면 바로 `Release` 해야 공유
+    메모리가 쌓이지 않는다. 남은 것은 `Close` (또는 with 문이 끝날 때) 에서
+    모두 지운다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `process_list`: `Apply_Block.Set_process` 에 넘기는 처리 과정 목록
+    - `worker_num`: 작업 프로세스 수 (None 이면 CPU 수)
+    - `min_bytes`: 공유 메모리로 보낼 최소 배열 크기
+
+    """
+    def __init__(
+        self,
+        process_list: list[dict[str, Any]],
+        worker_num: int | None = None,
+        min_bytes: int = 1 << 20
+    ) -> None:
+        self.process_list = process_list
+        self.worker_num = worker_num or cpu_count() or 1
+        self.transport = Image_Transport(min_bytes)
+
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+        return False
+
+    def _Get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: fork after cv2 / onnxruntime start their threads
+                self._pool = ProcessPoolExecutor(
+                    self.worker_num, mp_context=get_context("spawn"))
+            return self._pool
+
+    def _Submit(
+        self, file_name: str, img: np.ndarray
+    ) -> tuple[Shared_Image | np.ndarray, Future]:
+        _transport = self.transport
+        _packet = _transport.Pack(img)
+        try:
+            return _packet, self._Get_pool().submit(
+                _Run_shared, file_name, _packet, self.process_list,
+                _transport.min_bytes)
+        except Exception:
+            _transport.Release(_packet)
+            raise
+
+    def _Receive(
+        self, packet: Shared_Image | np.ndarray, future: Future
+    ) -> Shared_Result:
+        try:
+            _result = future.result()
+        finally:
+            self.transport.Release(packet)  # the input is done
+        return Shared_Result(self.transport, _result)
+
+    def Apply(self, file_name: str, img: np.ndarray) -> Shared_Result:
+        """
+        #### 한 장 처리하고 결과를 기다림 (여러 스레드에서 호출 가능)
+        ----------------------------------------------------------------
+        """
+        return self._Receive(*self._Submit(file_name, img))
+
+    def Run(
+        self, images: Iterable[tuple[str, np.ndarray]]
+    ) -> Iterator[tuple[str, Shared_Result | None, str | None]]:
+        """
+        #### 이미지 별 처리 결과 -> (이름, 결과, 오류) 를 입력 순서대로
+        ----------------------------------------------------------------
+        한 번에 작업 프로세스 수의 두 배까지만 공유 메모리에 올린다.
+        """
+        _running: list[tuple[str, Shared_Image | np.ndarray, Future]] = []
+        _images = iter(images)
+        _max_running = self.worker_num * 2
+
+        while True:
+            while len(_running) < _max_running:
+                _next = next(_images, None)
+                if _next is None:
+                    break
+                _running.append((_next[0], *self._Submit(*_next)))
+            if not _running:
+                break
+
+            _file_name, _packet, _future = _running.pop(0)
+            try:
+                _result = self._Receive(_packet, _future)
+            except Exception as _error:  # keep the batch going
+                yield _file_name, None, f"{type(_error).__name__}: {_error}"
+                continue
+            yield _file_name, _result, None
+
+    def Close(self):
+        with self._lock:
+            _pool, self._pool = self._pool, None
+        if _pool is not None:
+            _pool.shutdown()
+        self.transport.Close()
@@ -14,8 +14,9 @@ from __future__ import annotations
 from enum import Enum, auto
 
 import sys
-from glob import glob
-from os import path, getcwd, makedirs
+from fnmatch import fnmatch
+from os import path, getcwd, makedirs, replace, scandir, DirEntry
+from typing import Iterator
 import platform
 
 import yaml
@@ -194,57 +195,115 @@ class Path():
 
         return _exist, *Path.Divide(_file_path)
 
+    @staticmethod
+    def _Get_ext_list(ext_filter: str | list[str] | None) -> list[str]:
+        _ext_filter = [ext_filter] if isinstance(
+            ext_filter, str) else (ext_filter or [])
+        return [
+            (_ext if _ext[0] == "." else f".{_ext}").lower()
+            for _ext in _ext_filter if _ext
+        ]
+
+    @staticmethod
+    def Scan(
+        obj_path: str,
+        target: Path.Type | None = None,
+        keyword: str | None = None,
+        ext_filter: str | list[str] | None = None,
+        is_recursive: bool = False
+    ) -> Iterator[DirEntry]:
+        """ ### 디렉토리를 한 번만 읽어 조건에 맞는 항목을 차례로 반환
+        확장자는 대소문자를 구분하지 않고, 숨김 파일 (".") 은 건너뛴다.
+        파일 종류는 디렉토리 항목 정보를 사용하므로 추가 stat 이 없다.
+        링크된 디렉토리는 찾지만 그 안으로 들어가지는 않는다 (순환 방지).
+
+        ------------------------------------------------------------------
+        ### Args
+        - `obj_path`: 탐색할 디렉토리
+        - `target`: 찾을 대상 (파일 / 디렉토리, None 이면 모두)
+        - `keyword`: 확장자를 뺀 이름의 glob 패턴 (None 이면 모두)
+        - `ext_filter`: 확장자 목록 (None 이면 모두)
+        - `is_recursive`: 하위 디렉토리까지 탐색
+
+        ### Returns or Yields
+        - `DirEntry`: 찾은 항목 (디렉토리 안에서의 순서는 정렬되지 않음)
+
+        """
+        _ext_list = tuple(Path._Get_ext_list(ext_filter))
+        _stack = [obj_path]
+
+        while _stack:
+            with scandir(_stack.pop()) as _entries:
+                for _entry in _entries:
+                    _name = _entry.name
+                    if _name[0] == ".":
+                        continue
+
+                    _is_dir = _entry.is_dir()
+                    # a link to an ancestor would recurse forever
+                    if is_recursive and _entry.is_dir(follow_symlinks=False):
+                        _stack.append(_entry.path)
+
+                    if target is Path.Type.DIR and not _is_dir:
+                        continue
+                    if target is Path.Type.FILE and not _entry.is_file():
+                        continue
+
+                    if _ext_list:
+                        _lower = _name.lower()
+                        if not _lower.endswith(_ext_list):
+                            continue
+                        _stem = _name[:_name.rfind(".")]
+                    else:
+                        _stem = _name
+                    if keyword is not None and not fnmatch(_stem, keyword):
+                        continue
+
+                    yield _entry
+
+    @staticmethod
+    def Walk(
+        obj_path: str,
+        target: Path.Type | None = None,
+        keyword: str | None = None,
+        ext_filter: str | list[str] | None = None,
+        is_recursive: bool = False
+    ) -> Iterator[str]:
+        """
+        #### `Path.Scan` 으로 찾은 경로를 차례로 반환
+        ----------------------------------------------------------------
+        """
+        for _entry in Path.Scan(
+            obj_path, target, keyword, ext_filter, is_recursive
+        ):
+            yield _entry.path
+
     @staticmethod
     def Search(
         obj_path: str,
         target: Path.Type | None = None,
         keyword: str | None = None,
-        ext_filter: str | list[str] | None = None
+        ext_filter: str | list[str] | None = None,
+        is_recursive: bool = False
     ) -> list[str]:
-        """ ### Function feature description
-        Note
+        """ ### 조건에 맞는 경로의 정렬된 목록
+        `Path.Walk` 의 결과를 모두 모아 정렬한다.
 
         ------------------------------------------------------------------
         ### Args
-        - `arg_name`: Description of the input argument
+        - `Path.Walk` 와 같음
 
         ### Returns or Yields
-        - `data_format`: Description of the output argument
+        - `list[str]`: 찾은 경로 목록
 
         ### Raises
-        - `error_type`: Method of handling according to error issues
+        - `AssertionError`: `obj_path` 가 디렉토리가 아닐 때
 
         """
         assert Path.Exist_check(obj_path, Path.Type.DIR)
 
-        # make keyword
-        _obj_keyword = "*" if keyword is None else keyword
-
-        # make ext list
-        if isinstance(ext_filter, list):
-            _ext_list = [
-                _ext[1:] if _ext[0] == "." else _ext for _ext in ext_filter
-            ]
-        elif isinstance(ext_filter, str):
-            _ext_list = [
-                ext_filter[1:] if ext_filter[0] == "." else ext_filter
-            ]
-        else:
-            _ext_list = [""]
-
-        _searched_list = []
-
-        for _ext in _ext_list:
-            _list = sorted(glob(
-                Path.Join(
-                    _obj_keyword if _ext == "" else f"{_obj_keyword}.{_ext}",
-                    obj_path
-                ))
-            )
-            _searched_list += [
-                _file for _file in _list if Path.Exist_check(_file, target)
-            ]
-        return _searched_list
+        return sorted(Path.Walk(
+            obj_path, target, keyword, ext_filter, is_recursive))
 
 
 class File():
@@ -292,5 +351,16 @@ class File():
             file_dir: str,
             data,
             encoding_type: str = "UTF-8"
-        ):
-            raise NotImplementedError
+        ) -> str:
+            # make file path
+            _file = Path.Join(
+                File.Extension_checker(file_name, File.Support_Format.YAML),
+                file_dir)
+
+            # write to temp file then rename, so readers never see half
+            _temp = f"{_file}.tmp"
+            with open(_temp, "w", encoding=encoding_type) as _temp_file:
+                yaml.dump(
+                    data, _temp_file, allow_unicode=True, sort_keys=False)
+            replace(_temp, _file)
+            return _file
@@ -0,0 +1,271 @@
+""" ### Tiled, out-of-core image process for very large images
+
+------------------------------------------------------------------------
+### Requirement
+    numpy, opencv, tifffile
+
+### Structure
+    Tiled_Process: run a process list tile by tile, streaming from a
+        memory-mapped (or decoded-to-disk) tiff and writing a tiled tiff.
+
+    Only tile local steps (Masking) and geometric steps (Resize, Rotate,
+    Flip, manual Crop, and their fused Warp) can run in this mode.
+    Channel order is kept as stored in the tiff file.
+
+"""
+from __future__ import annotations
+from tempfile import TemporaryDirectory
+from typing import Any, Iterator
+
+import numpy as np
+import cv2
+import tifffile
+
+from utils.system import Path
+from utils.image_process import Process, Apply_Block
+
+
+class Tiled_Process():
+    """ ### 큰 이미지를 타일 단위로 나누어 처리
+
+    각 과정의 결과는 임시 memmap 파일에 쓰고, 마지막 과정은 타일 tiff 로
+    바로 기록하므로 메모리 사용량은 타일 크기에 비례한다.
+
+    ---------------------------------------------------------------------------
+    ### Args
+    - `process_list`: `Apply_Block.Set_process` 와 같은 과정 정보 목록
+    - `tile_size`: 타일 한 변의 길이 (16의 배수)
+    - `halo`: 보간을 위해 타일 주변에서 더 읽어올 픽셀 수
+    - `temp_dir`: 중간 결과를 저장할 경로 (기본: 시스템 임시 경로)
+
+    """
+    # source window of an output tile, at most this many tiles of pixels
+    # (a larger one, like a heavy downscale, splits the tile)
+    MAX_WINDOW_RATE = 16
+
+    def __init__(
+        self,
+        process_list: list[dict[str, Any]],
+        tile_size: int = 1024,
+        halo: int = 2,
+        temp_dir: str | None = None
+    ) -> None:
+        if tile_size % 16:
+            raise ValueError(f"tile size {tile_size} is not a multiple of 16")
+
+        _block = Apply_Block("", "", np.empty(0), is_cached=False)
+        _block.Set_process(process_list)
+
+        for _step in _block.compiled_list:
+            if not (_step.is_affine or _step.is_tile_local):
+                raise ValueError(
+                    f"{type(_step).__name__} can't run in tiled mode")
+
+        self.steps = _block.compiled_list
+        self.tile_size = tile_size
+        self.halo = halo
+        self.temp_dir = temp_dir
+
+    @staticmethod
+    def Open(img_file: str) -> np.ndarray:
+        """
+        #### 이미지를 디코딩하지 않고 memmap 으로 열기
+        ----------------------------------------------------------------
+        압축 또는 타일 tiff 는 임시 파일에 풀어 memmap 으로 반환하고,
+        tiff 가 아니면 일반적인 방법으로 읽음
+        """
+        if img_file.lower().endswith((".tif", ".tiff")):
+            try:
+                return tifffile.memmap(img_file, mode="r")
+            except ValueError:  # not contiguous -> decode into a temp file
+                return tifffile.imread(img_file, out="memmap")
+
+        _img = Process.Read(img_file)
+        if _img is None:
+            raise ValueError(f"can't decode {img_file}")
+        return _img
+
+    def _Get_tiles(self, shape: tuple[int, ...]):
+        _size = self.tile_size
+        _h, _w = shape[:2]
+        for _t in range(0, _h, _size):
+            for _l in range(0, _w, _size):
+                yield _t, min(_t + _size, _h), _l, min(_l + _size, _w)
+
+    @staticmethod
+    def _Read_tile(src: np.ndarray, tile: tuple[int, int, int, int]):
+        _t, _b, _l, _r = tile
+        return np.ascontiguousarray(src[_t: _b, _l: _r])
+
+    def _Prefilter(
+        self, src: np.ndarray, scale: int, file_path: str
+    ) -> np.ndarray:
+        """
+        #### 정수 배율 area 축소를 블록 단위로 memmap 에 기록
+        ----------------------------------------------------------------
+        `Process.Warp.Prefilter` 와 같은 결과. 블록은 배율의 배수라
+        경계가 없고, 한 번에 읽는 원본은 타일 크기 (또는 배율) 정도
+        """
+        _h, _w = src.shape[0] // scale, src.shape[1] // scale
+        _out = np.lib.format.open_memmap(
+            file_path, mode="w+", dtype=src.dtype,
+            shape=(_h, _w, *src.shape[2:]))
+
+        _step = max(self.tile_size // scale, 1)  # output pixels of a block
+        for _t in range(0, _h, _step):
+            for _l in range(0, _w, _step):
+                _b, _r = min(_t + _step, _h), min(_l + _step, _w)
+                _block = self._Read_tile(
+                    src, (_t * scale, _b * scale, _l * scale, _r * scale))
+                _out[_t: _b, _l: _r] = cv2.resize(
+                    _block, (_r - _l, _b - _t), interpolation=cv2.INTER_AREA
+                ).reshape(_b - _t, _r - _l, *src.shape[2:])
+        _out.flush()
+        return _out
+
+    def _Warp_tile(
+        self,
+        src: np.ndarray,
+        m: np.ndarray,
+        border: int,
+        tile: tuple[int, int, int, int],
+        interpolation: int = cv2.INTER_LINEAR
+    ) -> np.ndarray:
+        _t, _b, _l, _r = tile
+        _src_h, _src_w = src.shape[:2]
+        _halo = self.halo
+
+        # source area that the output tile reads (with halo)
+        _inv = np.linalg.inv(m)
+        _corner = _inv @ np.array([
+            [_l, _r - 1, _l, _r - 1],
+            [_t, _t, _b - 1, _b - 1],
+            [1, 1, 1, 1]
+        ], dtype=np.float64)
+        _sx0 = max(int(np.floor(_corner[0].min())) - _halo, 0)
+        _sx1 = min(int(np.ceil(_corner[0].max())) + _halo + 1, _src_w)
+        _sy0 = max(int(np.floor(_corner[1].min())) - _halo, 0)
+        _sy1 = min(int(np.ceil(_corner[1].max())) + _halo + 1, _src_h)
+
+        _shape = (_b - _t, _r - _l, *src.shape[2:])
+        if _sx0 >= _sx1 or _sy0 >= _sy1:  # tile is outside of the source
+            return np.zeros(_shape, src.dtype)
+
+        # the window is far larger than the tile: warp it in quarters
+        _max_area = self.MAX_WINDOW_RATE * self.tile_size ** 2
+        if (_sx1 - _sx0) * (_sy1 - _sy0) > _max_area and (
+            _b - _t > 1 or _r - _l > 1
+        ):
+            _mid_y, _mid_x = (_t + _b + 1) // 2, (_l + _r + 1) // 2
+            _out = np.empty(_shape, src.dtype)
+            for _part in (
+                (_t, _mid_y, _l, _mid_x), (_t, _mid_y, _mid_x, _r),
+                (_mid_y, _b, _l, _mid_x), (_mid_y, _b, _mid_x, _r)
+            ):
+                if _part[0] < _part[1] and _part[2] < _part[3]:
+                    _out[
+                        _part[0] - _t: _part[1] - _t,
+                        _part[2] - _l: _part[3] - _l
+                    ] = self._Warp_tile(src, m, border, _part, interpolation)
+            return _out
+
+        # move both origins to the tile corners
+        _m = np.array([[1, 0, -_l], [0, 1, -_t], [0, 0, 1]]) @ m @ np.array(
+            [[1, 0, _sx0], [0, 1, _sy0], [0, 0, 1]])
+        _window = np.ascontiguousarray(src[_sy0: _sy1, _sx0: _sx1])
+
+        _tile = Process.Warp.Apply(
+            _window, _m, (_b - _t, _r - _l), interpolation, border)
+        return _tile.reshape(_shape)
+
+    def _Run_step(
+        self, step: Process.Basement, src: np.ndarray, prefilter_file: str
+    ) -> tuple[tuple[int, ...], Iterator[np.ndarray]]:
+        if step.is_affine:
+            _m, (_h, _w) = step.Get_affine(src.shape)
+            _shape = (_h, _w, *src.shape[2:])
+            _flag, _is_prefiltered = Process.Warp.Get_flag(
+                step.warp_interpolation)
+            _scale = Process.Warp.Get_prefilter(_m) if _is_prefiltered else 1
+
+            # a heavy downscale reads most of the source for every tile,
+            # shrink the whole source to disk first and warp from that
+            if _scale > 1 and src.shape[0] >= _scale and (
+                src.shape[1] >= _scale
+            ):
+                src = self._Prefilter(src, _scale, prefilter_file)
+                _center = (_scale - 1) / 2
+                _m = _m @ np.array([
+                    [_scale, 0, _center], [0, _scale, _center], [0, 0, 1]])
+
+            _tiles = (
+                self._Warp_tile(src, _m, step.border, _tile, _flag)
+                for _tile in self._Get_tiles(_shape)
+            )
+            return _shape, _tiles
+
+        # tile local step: the output shape follows the first tile
+        _size = self.tile_size
+        _probe = step.Slice(src.shape, 0, _size, 0, _size)(
+            self._Read_tile(src, (0, _size, 0, _size)))
+        _shape = (*src.shape[:2], *_probe.shape[2:])
+        _tiles = (
+            step.Slice(src.shape, *_tile)(self._Read_tile(src, _tile))
+            for _tile in self._Get_tiles(_shape)
+        )
+        return _shape, _tiles
+
+    def _Write_memmap(
+        self,
+        file_path: str,
+        shape: tuple[int, ...],
+        dtype: np.dtype,
+        tiles: Iterator[np.ndarray]
+    ) -> np.ndarray:
+        _out = np.lib.format.open_memmap(
+            file_path, mode="w+", dtype=dtype, shape=shape)
+        for (_t, _b, _l, _r), _tile in zip(self._Get_tiles(shape), tiles):
+            _out[_t: _b, _l: _r] = _tile
+        _out.flush()
+        return _out
+
+    def __call__(
+        self,
+        input_file: str,
+        output_file: str,
+        compression: str | None = None
+    ) -> tuple[int, ...]:
+        _src = self.Open(input_file)
+        _steps = self.steps
+
+        with TemporaryDirectory(dir=self.temp_dir) as _temp_dir:
+            _shape: tuple[int, ...] = _src.shape
+            _tiles: Iterator[np.ndarray] = (
+                self._Read_tile(_src, _tile)
+                for _tile in self._Get_tiles(_shape)
+            )
+            _dtype = _src.dtype
+
+            for _ct, _step in enumerate(_steps):
+                if _ct:  # the former step is spilled to disk first
+                    _src = self._Write_memmap(
+                        Path.Join(f"step_{_ct}.npy", _temp_dir),
+                        _shape, _dtype, _tiles)
+                _shape, _tiles = self._Run_step(
+                    _step, _src,
+                    Path.Join(f"prefilter_{_ct}.npy", _temp_dir))
+
+            _channel = _shape[2] if len(_shape) > 2 else 1
+            tifffile.imwrite(
+                output_file,
+                _tiles,  # edge tiles are zero-padded by tifffile
+                shape=_shape,
+                dtype=_dtype,
+                tile=(self.tile_size, self.tile_size),
+                photometric="rgb" if _channel in (3, 4) else "minisblack",
+                extrasamples=["unassalpha"] if _channel == 4 else None,
+                compression=compression
+            )
+            del _src, _tiles  # release memmaps before removing the temp dir
+
+        return _shape
@@ -0,0 +1,253 @@
+""" ### Light per step tracing with Chrome trace export
+
+------------------------------------------------------------------------
+### Requirement
+    numpy
+
+### Structure
+    Tracer: record a span (start, wall time, cpu time, image shape and
+        bytes) around read, each process step and write, then export
+        them as Chrome trace events (chrome://tracing, Perfetto) or
+        print a summary table per span name.
+
+    When it is disabled, `Tracer.Span` returns one shared empty context,
+    so instrumented code costs a method call and a flag check.
+
+"""
+from __future__ import annotations
+import json
+import tracemalloc
+from os import getpid
+from threading import Lock, local, get_ident
+from time import perf_counter_ns, thread_time_ns
+from typing import Any
+
+import numpy as np
+
+
+def _Describe(img: Any) -> dict[str, Any]:
+    if isinstance(img, np.ndarray):
+        return {"shape": list(img.shape), "bytes": img.nbytes}
+    if isinstance(img, str):
+        return {"file": img}
+    return {}
+
+
+class _Empty_Span():
+    """ 추적을 끈 상태의 span (아무것도 하지 않음) """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def Set_output(self, img: Any):
+        pass
+
+
+_EMPTY_SPAN = _Empty_Span()
+
+
+class _Span():
+    def __init__(
+        self, name: str, category: str, args: dict[str, Any]
+    ) -> None:
+        self.name = name
+        self.category = category
+        self.args = args
+
+        self.start = 0
+        self.cpu_start = 0
+        self.memory_base = 0
+        self.memory_peak = 0
+
+    def __enter__(self):
+        _stack = Tracer._Get_stack()
+        if Tracer.is_memory_traced and tracemalloc.is_tracing():
+            _current, _peak = tracemalloc.get_traced_memory()
+            if _stack:  # keep the peak of the parent before resetting it
+                _parent = _stack[-1]
+                _parent.memory_peak = max(_parent.memory_peak, _peak)
+            tracemalloc.reset_peak()
+            self.memory_base = _current
+        _stack.append(self)
+
+        self.cpu_start = thread_time_ns()
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        _end = perf_counter_ns()
+        _cpu_end = thread_time_ns()
+
+        _stack = Tracer._Get_stack()
+        _stack.pop()
+        _args = self.args
+        if Tracer.is_memory_traced and tracemalloc.is_tracing():
+            _peak = max(self.memory_peak, tracemalloc.get_traced_memory()[1])
+            _args["alloc_bytes"] = max(_peak - self.memory_base, 0)
+            if _stack:
+                _stack[-1].memory_peak = max(_stack[-1].memory_peak, _peak)
+        if exc_type is not None:
+            _args["error"] = exc_type.__name__
+
+        Tracer.Add({
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": self.start / 1000,
+            "dur": (_end - self.start) / 1000,
+            "pid": getpid(),
+            "tid": get_ident(),
+            "args": {"cpu_us": (_cpu_end - self.cpu_start) / 1000, **_args}
+        })
+        return False
+
+    def Set_output(self, img: Any):
+        """ 출력 이미지의 크기 기록 """
+        for _key, _value in _Describe(img).items():
+            self.args[f"output_{_key}"] = _value
+
+
+class Tracer():
+    """ ### 처리 과정 별 시간 추적기 (프로세스 전역)
+
+    `Span` 으로 감싼 구간의 벽 시간, 스레드 CPU 시간, 입출력 크기를
+    Chrome trace event 로 모은다. CPU 시간이 벽 시간보다 한참 짧은 구간은
+    디스크나 네트워크를 기다리는 구간이다.
+
+    `is_memory` 로 켜면 tracemalloc 으로 구간의 최대 할당량도 기록한다
+    (느려지고, 여러 스레드가 동시에 돌면 서로의 할당이 섞인다).
+
+    ---------------------------------------------------------------------------
+    """
+    is_enabled: bool = False
+    is_memory_traced: bool = False
+
+    events: list[dict[str, Any]] = []
+    _lock = Lock()
+    _local = local()
+
+    @classmethod
+    def Enable(cls, is_memory: bool = False):
+        cls.is_memory_traced = is_memory
+        if is_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        cls.is_enabled = True
+
+    @classmethod
+    def Disable(cls):
+        cls.is_enabled = False
+        if cls.is_memory_traced and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        cls.is_memory_traced = False
+
+    @classmethod
+    def _Get_stack(cls) -> list[_Span]:
+        _stack = getattr(cls._local, "stack", None)
+        if _stack is None:
+            _stack = cls._local.stack = []
+        return _stack
+
+    @classmethod
+    def Span(
+        cls,
+        name: str,
+        category: str = "step",
+        img: Any = None,
+        **args: Any
+    ) -> _Span | _Empty_Span:
+        """
+        #### with 문으로 감싼 구간을 기록 (img: 입력 배열 또는 파일 경로)
+        ----------------------------------------------------------------
+        """
+        if not cls.is_enabled:
+            return _EMPTY_SPAN
+        return _Span(name, category, {**_Describe(img), **args})
+
+    @classmethod
+    def Add(cls, event: dict[str, Any]):
+        with cls._lock:
+            cls.events.append(event)
+
+    @classmethod
+    def Extend(cls, events: list[dict[str, Any]]):
+        """ 다른 프로세스에서 기록한 event 합치기 """
+        if events:
+            with cls._lock:
+                cls.events.extend(events)
+
+    @classmethod
+    def Pop_events(cls) -> list[dict[str, Any]]:
+        with cls._lock:
+            _events, cls.events = cls.events, []
+        return _events
+
+    @classmethod
+    def Clear(cls):
+        with cls._lock:
+            cls.events = []
+
+    @classmethod
+    def Export(cls, file_path: str) -> str:
+        """
+        #### Chrome trace event 형식의 json 으로 저장
+        ----------------------------------------------------------------
+        """
+        with cls._lock:
+            _events = list(cls.events)
+        with open(file_path, "w", encoding="UTF-8") as _file:
+            json.dump(
+                {"traceEvents": _events, "displayTimeUnit": "ms"}, _file)
+        return file_path
+
+    @classmethod
+    def Summary(cls) -> list[dict[str, Any]]:
+        """
+        #### 구간 이름 별 횟수, 전체 / 평균 / p95 시간 (ms), CPU 비율
+        ----------------------------------------------------------------
+        전체 시간이 긴 순서로 정렬
+        """
+        with cls._lock:
+            _events = list(cls.events)
+
+        _group: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for _event in _events:
+            _group.setdefault(
+                (_event["cat"], _event["name"]), []).append(_event)
+
+        _rows = []
+        for (_category, _name), _list in _group.items():
+            _wall = np.array([_e["dur"] for _e in _list]) / 1000
+            _cpu = sum(_e["args"].get("cpu_us", 0) for _e in _list) / 1000
+            _total = float(_wall.sum())
+            _rows.append({
+                "category": _category,
+                "name": _name,
+                "count": len(_list),
+                "total_ms": _total,
+                "mean_ms": _total / len(_list),
+                "p95_ms": float(np.percentile(_wall, 95)),
+                "cpu_rate": _cpu / _total if _total > 0 else 0.0,
+                "alloc_bytes": max(
+                    (_e["args"]["alloc_bytes"] for _e in _list
+                     if "alloc_bytes" in _e["args"]),
+                    default=None)
+            })
+        return sorted(_rows, key=lambda _row: -_row["total_ms"])
+
+    @classmethod
+    def Format_summary(cls) -> str:
+        _lines = [
+            f"{'category':<8} {'name':<20} {'count':>6} {'total ms':>10} "
+            f"{'mean ms':>9} {'p95 ms':>9} {'cpu':>5} {'peak MB':>8}"
+        ]
+        for _row in cls.Summary():
+            _lines.append(
+                f"{_row['category']:<8} {_row['name']:<20} "
+                f"{_row['count']:>6} {_row['total_ms']:>10.1f} "
+                f"{_row['mean_ms']:>9.2f} {_row['p95_ms']:>9.2f} "
+                f"{_row['cpu_rate']:>5.0%} " + (
+                    f"{'-':>8}" if _row["alloc_bytes"] is None else
+                    f"{_row['alloc_bytes'] / (1 << 20):>8.1f}"))
+        return "\n".join(_lines)